@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""Benchmarks for the decode, normalize, geometry, graph and simulation hot
+paths.  Every case uses fixed seeds; results are written as JSON so runs can
+be compared across commits:
+
+    python benchmarks/bench.py --output before.json
+    python benchmarks/bench.py --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import timeit
+
+import numpy
+import linkage.genome
+import linkage.kinematics
+import linkage.primitives
+import linkage.trajectory
+
+Sizes = (100, 1000, 10000)
+Seed = 1
+
+def measure(func, setup=None, repeat=5):
+    # Times func(state) repeat times, with a fresh, untimed state = setup()
+    # for each run.  Each bench_* function returns the (func, setup) pair
+    # for its size.
+    times = []
+    for x in range(repeat):
+        state = None
+        if setup != None:
+            state = setup()
+        started = timeit.default_timer()
+        func(state)
+        times.append(timeit.default_timer() - started)
+    return times
+
+def parsed(length, normalize=False):
+    genome = linkage.genome.GearPivotGenome.random_genome(length, seed=Seed)
+    specie = linkage.genome.GearPivotSpecie()
+    specie.parse(genome)
+    if normalize:
+        specie.normalize_graph()
+    return specie
+
+def bench_random_genome(size):
+    return (lambda state: linkage.genome.GearPivotGenome.random_genome(size, seed=Seed), None)
+
+def bench_parse(size):
+    genome = linkage.genome.GearPivotGenome.random_genome(size, seed=Seed)
+    return (lambda specie: specie.parse(genome), linkage.genome.GearPivotSpecie)
+
+def bench_normalize_graph(size):
+    return (lambda specie: specie.normalize_graph(), lambda: parsed(size))
+
+def path_endpoints(specie):
+    nodes = sorted(specie.graph, key=lambda node: node.name)
+    return (specie.gears[0], nodes[-1])
+
+def bench_dijkstra(size):
+    specie = parsed(size, normalize=True)
+    (source, target) = path_endpoints(specie)
+    return (lambda state: specie.graph.dijkstra(source, target), None)
+
+def bench_path(size):
+    specie = parsed(size, normalize=True)
+    (source, target) = path_endpoints(specie)
+    return (lambda state: specie.graph.path(source, target), None)
+
+def bench_compact_path(size):
+    specie = parsed(size, normalize=True)
+    (source, target) = path_endpoints(specie)
+    compact = specie.graph.freeze()
+    return (lambda state: compact.path(source, target), None)
+
+def circles(size):
+    rng = numpy.random.RandomState(Seed)
+    centers_a = rng.uniform(0, 10, (size, 2))
+    centers_b = centers_a + rng.uniform(-4, 4, (size, 2))
+    return (centers_a, centers_b)
+
+def bench_circle_intersect(size):
+    (centers_a, centers_b) = circles(size)
+    pairs = [(linkage.primitives.Circle(a, 3), linkage.primitives.Circle(b, 3)) for (a, b) in zip(centers_a.tolist(), centers_b.tolist())]
+    def intersect(state):
+        for (circle_a, circle_b) in pairs:
+            try:
+                circle_a.intersect(circle_b)
+            except ValueError:
+                pass
+    return (intersect, None)
+
+def bench_vectorized_intersect(size):
+    (centers_a, centers_b) = circles(size)
+    return (lambda state: linkage.kinematics.circle_intersect(centers_a, 3.0, centers_b, 3.0), None)
+
+def bench_trajectory_summary(size):
+    rng = numpy.random.RandomState(Seed)
+    angles = numpy.linspace(0, 2 * numpy.pi, size, endpoint=False)
+    radii = rng.uniform(1, 5, (16, 1))
+    curves = numpy.dstack((radii * numpy.cos(angles), radii * numpy.sin(2 * angles)))
+    return (lambda state: linkage.trajectory.summarize(curves), None)
+
+def world():
+    import linkage.physics
+    world = linkage.physics.World((500, 500))
+    linkage.physics.use_case_one(world)
+    return world
+
+def bench_embed(size):
+    return (lambda state: world(), None)
+
+def bench_world_step(size):
+    def step(world):
+        for x in range(size):
+            world.step(1.0 / 300.0)
+    return (step, world)
+
+Cases = [
+    ("random_genome", Sizes, bench_random_genome),
+    ("parse", Sizes, bench_parse),
+    ("normalize_graph", Sizes, bench_normalize_graph),
+    ("dijkstra", Sizes, bench_dijkstra),
+    ("path", Sizes, bench_path),
+    ("compact_path", Sizes, bench_compact_path),
+    ("circle_intersect", Sizes, bench_circle_intersect),
+    ("vectorized_intersect", Sizes, bench_vectorized_intersect),
+    ("trajectory_summary", Sizes, bench_trajectory_summary),
+    ("embed", (1,), bench_embed),
+    ("world_step", Sizes, bench_world_step),
+]
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(pattern=None, repeat=5):
+    results = []
+    for (name, sizes, bench) in Cases:
+        if pattern and pattern not in name:
+            continue
+        for size in sizes:
+            random.seed(Seed)
+            result = {"name": name, "size": size}
+            try:
+                (func, setup) = bench(size)
+                times = measure(func, setup, repeat)
+            except ImportError as err:
+                # the physics cases need pymunk and scad
+                result["skipped"] = str(err)
+            except Exception as err:
+                # one broken case is reported, not fatal to the run
+                result["error"] = "%s: %s" % (err.__class__.__name__, err)
+            else:
+                result["best"] = min(times)
+                result["median"] = float(numpy.median(times))
+                result["runs"] = len(times)
+            results.append(result)
+            sys.stderr.write("%s\n" % json.dumps(result, sort_keys=True))
+    return {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "results": results,
+    }
+
+def compare(report, baseline):
+    # Prints the ratio of each case's best time to the baseline's.
+    previous = dict(((result["name"], result["size"]), result) for result in baseline["results"])
+    for result in report["results"]:
+        old = previous.get((result["name"], result["size"]))
+        if "best" not in result or not old or "best" not in old:
+            continue
+        ratio = result["best"] / old["best"]
+        print "%-22s %6d  %10.6fs  %10.6fs  %5.2fx" % (result["name"], result["size"], old["best"], result["best"], ratio)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the linkage hot paths.")
+    parser.add_argument("--filter", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="a previous JSON report to compare against")
+    args = parser.parse_args()
+    report = run(args.filter, args.repeat)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+    elif not args.compare:
+        print json.dumps(report, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(report, json.load(fh))
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from distutils.core import setup
+from setuptools import setup
 
 sctk = {
     "name": "linkage",
@@ -9,6 +9,9 @@ sctk = {
     "packages": ["linkage"],
     "package_dir": {"linkage": "src"},
     "version": "0.1",
+    "entry_points": {
+        "console_scripts": ["linkage = linkage.cli:main"],
+    },
 }
 
 if __name__ == "__main__":
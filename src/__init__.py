@@ -1,2 +1,7 @@
+# Only the core decode, graph and geometry modules are imported with the
+# package, and none of them need pyglet, pymunk or graphviz.  The physics and
+# rendering backends (physics, visualization, dotgraph, raster) are loaded on
+# first use, e.g. `import linkage.physics`.
 import genome
-import visualization
+import graph
+import primitives
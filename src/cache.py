@@ -0,0 +1,130 @@
+import collections
+import hashlib
+import shelve
+
+def _round(value, precision):
+    if isinstance(value, float):
+        return round(value, precision)
+    if isinstance(value, (tuple, list)):
+        return tuple(_round(item, precision) for item in value)
+    return value
+
+def canonical_hash(specie, precision=9):
+    # Hashes a normalized specie by structure and numeric parameters, but not
+    # by node names, which depend on how many genes were stripped during
+    # normalization.  Node labels are refined Weisfeiler-Lehman style until
+    # the partition of the graph stops changing.
+    motor = specie.gears[0]
+    nodes = list(specie.graph)
+    labels = {}
+    for node in nodes:
+        if node is motor:
+            kind = "motor"
+        else:
+            kind = node.name.split("-")[0]
+        labels[node] = repr((kind, _round(node.parameters(), precision)))
+    for iteration in range(len(nodes)):
+        refined = {}
+        for node in nodes:
+            neighbors = sorted(labels[neighbor] for neighbor in specie.graph[node])
+            label = "%s|%s" % (labels[node], ",".join(neighbors))
+            refined[node] = hashlib.sha1(label).hexdigest()
+        stable = len(set(refined.values())) == len(set(labels.values()))
+        labels = refined
+        if stable:
+            break
+    digest = hashlib.sha1()
+    for label in sorted(labels.values()):
+        digest.update(label)
+    return digest.hexdigest()
+
+# The cached result of a genome or mechanism that can not be scored, told
+# apart from a key that is not cached at all.
+Infeasible = "infeasible"
+
+class FitnessCache(object):
+    # An in-memory LRU of results keyed by strings built from canonical_hash
+    # values, optionally backed by a shelve file so results survive between
+    # runs.  get counts a hit or a miss per call; callers that resolve one
+    # lookup in several steps use lookup and count the outcome with record.
+    def __init__(self, maxsize=4096, path=None):
+        self.maxsize = maxsize
+        self.memory = collections.OrderedDict()
+        self.store = None
+        self.stored = None
+        if path != None:
+            self.store = shelve.open(path)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.memory or (self.store != None and key in self.store)
+
+    def lookup(self, key, default=None):
+        if key in self.memory:
+            value = self.memory.pop(key)
+        elif self.store != None and key in self.store:
+            value = self.store[key]
+            self.disk_hits += 1
+        else:
+            return default
+        self.memory[key] = value
+        self.trim()
+        return value
+
+    def get(self, key, default=None):
+        if key not in self:
+            self.record(False)
+            return default
+        self.record(True)
+        return self.lookup(key)
+
+    def record(self, hit, count=1):
+        if hit:
+            self.hits += count
+        else:
+            self.misses += count
+
+    def put(self, key, value):
+        self.memory.pop(key, None)
+        self.memory[key] = value
+        self.trim()
+        if self.store != None:
+            self.store[key] = value
+            if self.stored != None:
+                self.stored.add(key)
+
+    def keys(self, prefix=""):
+        # The keys starting with prefix, in memory or on disk, with the
+        # prefix stripped.  The shelve's keys are read once and then kept
+        # up to date by put.
+        keys = [key for key in self.memory if key.startswith(prefix)]
+        if self.store != None:
+            if self.stored == None:
+                self.stored = set(self.store.keys())
+            keys.extend(key for key in self.stored if key.startswith(prefix))
+        return set(key[len(prefix):] for key in keys)
+
+    def trim(self):
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = 0.0
+        if lookups:
+            hit_rate = self.hits / float(lookups)
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hit_rate,
+            "size": len(self.memory),
+        }
+
+    def close(self):
+        if self.store != None:
+            self.store.close()
+            self.store = None
+            self.stored = None
@@ -0,0 +1,231 @@
+"""Headless command line entry point.
+
+    linkage generate --count 1000 --length 200 --seed 1 population/
+    linkage evaluate population/ --workers 16 --output scores.jsonl
+    linkage evolve --generations 50 --workers 16 --save final/
+    linkage evolve --generations 50 --listen :50000 --authkey secret
+    linkage worker coordinator-host:50000 --authkey secret
+    linkage serve localhost:7878 --workers 8
+
+Results are written as JSON lines, one object per line, to stdout or to
+--output, and flushed as they are produced.
+"""
+
+import argparse
+import importlib
+import json
+import sys
+
+import numpy
+
+from . import cache
+from . import distributed
+from . import evolution
+from . import genome
+from . import instrument
+from . import population
+from . import service
+
+def load_scorer(args):
+    # --scorer names a Scorer class (or any factory) as module:attribute;
+    # it is called with the --steps budget as steps.
+    factory = genome.Scorer
+    if args.scorer:
+        (module, attribute) = args.scorer.split(":")
+        factory = getattr(importlib.import_module(module), attribute)
+    return factory(steps=args.steps)
+
+def parse_address(address):
+    (host, port) = address.rsplit(":", 1)
+    return (host, int(port))
+
+def make_evaluator(args):
+    fitness_cache = None
+    if args.cache:
+        fitness_cache = cache.FitnessCache(path=args.cache)
+    if args.listen:
+        return distributed.Coordinator(parse_address(args.listen), args.authkey, batch_size=args.chunksize,
+                                       timeout=args.timeout, cache=fitness_cache, scorer=load_scorer(args))
+    return genome.PopulationEvaluator(load_scorer(args), workers=args.workers, chunksize=args.chunksize,
+                                      timeout=args.timeout, cache=fitness_cache)
+
+def close_evaluator(evaluator):
+    evaluator.close()
+    if evaluator.cache != None:
+        evaluator.cache.close()
+
+class Output(object):
+    def __init__(self, path):
+        self.stream = sys.stdout
+        if path and path != "-":
+            self.stream = open(path, "w")
+
+    def write(self, record):
+        self.stream.write(json.dumps(record, sort_keys=True) + "\n")
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+def score_value(score):
+    if score == None:
+        return None
+    return float(score)
+
+def command_generate(args, output):
+    genomes = genome.GearPivotGenome.random_population(args.count, args.length, args.seed)
+    population.PopulationStore.save(args.population, genomes)
+    output.write({"population": args.population, "count": args.count, "length": args.length})
+
+def command_evaluate(args, output):
+    mode = "r+" if args.record else "r"
+    store = population.PopulationStore.open(args.population, mode=mode)
+    evaluator = make_evaluator(args)
+    try:
+        for start in range(0, len(store), args.batch):
+            genomes = [store[idx] for idx in range(start, min(start + args.batch, len(store)))]
+            scores = evaluator.evaluate(genomes)
+            for (idx, score) in enumerate(scores):
+                output.write({"index": start + idx, "score": score_value(score)})
+            if args.record:
+                store.record_fitness(scores, start)
+        if args.record:
+            store.flush()
+    finally:
+        close_evaluator(evaluator)
+    if evaluator.cache != None:
+        output.write({"cache": evaluator.cache.stats()})
+
+def seed_genes(path):
+    # The Evolver works on one genome length, so a seed population must
+    # have a single length; the zero padding past it is not part of any
+    # genome and is dropped.
+    store = population.PopulationStore.open(path)
+    lengths = numpy.unique(store.metadata["length"])
+    if len(lengths) != 1:
+        raise SystemExit("linkage: %s holds genomes of several lengths (%s)" % (path, ", ".join(map(str, lengths))))
+    return numpy.array(store.genes[:, :lengths[0]])
+
+def command_evolve(args, output):
+    genes = None
+    length = args.length
+    size = args.population_size
+    if args.population:
+        genes = seed_genes(args.population)
+        length = genes.shape[1]
+        if size == None:
+            size = len(genes)
+    if size == None:
+        size = 100
+    evaluator = make_evaluator(args)
+    try:
+        evolver = evolution.Evolver(evaluator, population_size=size, genome_length=length,
+                                    selection=args.selection, crossover=args.crossover,
+                                    mutation_rate=args.mutation_rate, elitism=args.elitism, seed=args.seed)
+    except ValueError as err:
+        close_evaluator(evaluator)
+        raise SystemExit("linkage: %s" % err)
+    evolver.initialize(genes)
+    try:
+        evolver.run(args.generations, output.write)
+    finally:
+        close_evaluator(evolver.evaluator)
+    if args.save:
+        population.PopulationStore.save(args.save, evolver.genomes(), evolver.generation)
+    if evolver.best != None:
+        (best, fitness) = evolver.best
+        output.write({"best": best.genes.tolist(), "fitness": float(fitness)})
+
+def command_worker(args, output):
+    address = parse_address(args.coordinator)
+    batches = distributed.run_worker(address, args.authkey, load_scorer(args))
+    output.write({"worker": distributed.worker_name(), "batches": batches})
+
+def command_serve(args, output):
+    server = service.EvaluationServer(parse_address(args.address), load_scorer(args), workers=args.workers,
+                                      chunksize=args.chunksize, max_pending=args.max_pending)
+    output.write({"serving": "%s:%d" % server.server_address})
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def add_evaluation_options(parser):
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunksize", type=int, default=16, help="genomes per worker task")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds each chunk may run on a worker")
+    parser.add_argument("--scorer", help="scorer factory as module:attribute")
+    parser.add_argument("--steps", type=int, default=None, help="simulation step budget per genome")
+    parser.add_argument("--cache", help="shelve file for the fitness cache")
+    parser.add_argument("--listen", help="hand batches to remote workers from host:port")
+    parser.add_argument("--authkey", help="secret shared with the workers; required with --listen")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="linkage", description="Headless linkage evolution and evaluation.")
+    parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    parser.add_argument("--profile", help="record stage timers, workers included, and write them here as JSON")
+    commands = parser.add_subparsers(dest="command")
+
+    generate = commands.add_parser("generate", help="write a random population")
+    generate.add_argument("population", help="population directory to create")
+    generate.add_argument("--count", type=int, default=100)
+    generate.add_argument("--length", type=int, default=200)
+    generate.add_argument("--seed", type=int, default=None)
+
+    evaluate = commands.add_parser("evaluate", help="score every genome of a population")
+    evaluate.add_argument("population", help="population directory")
+    evaluate.add_argument("--batch", type=int, default=1024, help="genomes per streamed batch")
+    evaluate.add_argument("--record", action="store_true", help="store the fitness in the population")
+    add_evaluation_options(evaluate)
+
+    evolve = commands.add_parser("evolve", help="run the evolutionary loop")
+    evolve.add_argument("--generations", type=int, default=10)
+    evolve.add_argument("--population", help="seed from this population directory, of one genome length")
+    evolve.add_argument("--population-size", type=int, default=None,
+                        help="genomes per generation (default: the seed population's size, or 100)")
+    evolve.add_argument("--length", type=int, default=200)
+    evolve.add_argument("--selection", default="tournament", choices=["tournament", "roulette"])
+    evolve.add_argument("--crossover", default="one_point", choices=["one_point", "two_point", "uniform"])
+    evolve.add_argument("--mutation-rate", type=float, default=0.01)
+    evolve.add_argument("--elitism", type=int, default=2)
+    evolve.add_argument("--seed", type=int, default=None)
+    evolve.add_argument("--save", help="write the final population to this directory")
+    add_evaluation_options(evolve)
+
+    worker = commands.add_parser("worker", help="score batches for a coordinator")
+    worker.add_argument("coordinator", help="coordinator host:port")
+    worker.add_argument("--authkey", required=True, help="the coordinator's secret key")
+    worker.add_argument("--scorer", help="scorer factory as module:attribute")
+    worker.add_argument("--steps", type=int, default=None, help="simulation step budget per genome")
+
+    serve = commands.add_parser("serve", help="score genomes sent over a socket")
+    serve.add_argument("address", help="host:port to listen on")
+    serve.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    serve.add_argument("--chunksize", type=int, default=8, help="genomes per worker task")
+    serve.add_argument("--max-pending", type=int, default=64, help="chunks queued before reading stops")
+    serve.add_argument("--scorer", help="scorer factory as module:attribute")
+    serve.add_argument("--steps", type=int, default=None, help="simulation step budget per genome")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "listen", None) and not args.authkey:
+        parser.error("--listen needs --authkey: workers' results are unpickled by the coordinator")
+    output = Output(args.output)
+    if args.profile:
+        instrument.enable()
+    try:
+        command = globals()["command_%s" % args.command]
+        command(args, output)
+    finally:
+        output.close()
+        if args.profile:
+            with open(args.profile, "w") as fh:
+                fh.write(instrument.to_json(indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""Evaluation across machines.
+
+A Coordinator serves a work queue over TCP with multiprocessing.managers and
+hands out batches of genomes; workers on any host connect, decode and score
+each batch with genome.evaluate_chunk, and send the scores back.
+
+    coordinator = Coordinator(address=("", 50000), authkey=secret)
+    evolver = evolution.Evolver(coordinator)
+
+    # on each worker host
+    run_worker(("coordinator-host", 50000), secret)
+
+Connections are authenticated with authkey, but everything a worker sends
+is unpickled by the coordinator, so the key has to stay secret.  Without
+one, the coordinator listens on loopback only, under a random key.
+
+Every batch handed out is leased; a batch whose worker has not answered
+when the lease runs out, or that reports an error, goes back on the queue,
+up to retries times before its genomes score None.  Late answers for a
+batch that has already been scored are dropped.
+"""
+
+import collections
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from multiprocessing import connection
+from multiprocessing.managers import BaseManager
+
+import numpy
+
+from . import genome
+from . import instrument
+
+def pack_genomes(genomes):
+    # genomes travel as their lengths and one string of uint32 genes
+    lengths = [len(item) for item in genomes]
+    if not genomes:
+        return (lengths, "")
+    genes = numpy.concatenate([numpy.asarray(item.genes, dtype=numpy.uint32) for item in genomes])
+    return (lengths, genes.tostring())
+
+def unpack_genomes(lengths, data, genome_class=genome.GearPivotGenome):
+    genes = numpy.fromstring(data, dtype=numpy.uint32)
+    offsets = numpy.cumsum([0] + lengths)
+    return [genome_class(genes[start:stop]) for (start, stop) in zip(offsets[:-1], offsets[1:])]
+
+class WorkQueue(object):
+    # The coordinator's side of the protocol.  Workers call request, submit
+    # and fail through a manager proxy, each connection on its own server
+    # thread, so all state is guarded by one condition.
+    def __init__(self, lease=60.0, retries=3):
+        self.lease = lease
+        self.retries = retries
+        self.condition = threading.Condition()
+        self.pending = collections.deque()
+        self.tasks = {}
+        self.leases = {}
+        self.began = {}
+        self.attempts = collections.Counter()
+        self.results = {}
+        self.next_id = 0
+        self.known = None
+        self.known_version = 0
+        self.closed = False
+
+    def share(self, known):
+        # Publishes the mechanism keys the coordinator has scores for and
+        # returns their version; tasks name the version, and a worker only
+        # fetches the keys when it changes.
+        with self.condition:
+            self.known = known
+            self.known_version += 1
+            return self.known_version
+
+    def shared(self, version):
+        # the keys of that version, or None once they have been replaced
+        with self.condition:
+            if version != self.known_version:
+                return None
+            return self.known
+
+    def put(self, lengths, data, known_version=None, profile=False):
+        with self.condition:
+            task_id = self.next_id
+            self.next_id += 1
+            self.tasks[task_id] = (lengths, data, known_version, profile)
+            self.pending.append(task_id)
+            return task_id
+
+    def request(self, worker):
+        # Returns ("task", task_id, lengths, data, known_version, profile),
+        # ("wait",) when the queue is empty, or ("stop",) once the
+        # coordinator has closed.
+        with self.condition:
+            if self.closed:
+                return ("stop",)
+            self.expire()
+            if not self.pending:
+                return ("wait",)
+            task_id = self.pending.popleft()
+            self.leases[task_id] = (worker, time.time() + self.lease)
+            self.began.setdefault(task_id, time.time())
+            (lengths, data, known_version, profile) = self.tasks[task_id]
+            return ("task", task_id, lengths, data, known_version, profile)
+
+    def submit(self, worker, task_id, scores, timings, keys, stats=None):
+        with self.condition:
+            if task_id not in self.tasks:
+                return False
+            self.finish(task_id, (scores, timings, keys, stats))
+            return True
+
+    def fail(self, worker, task_id, message):
+        with self.condition:
+            if task_id in self.leases and self.leases[task_id][0] == worker:
+                self.retry(task_id)
+
+    def expire(self):
+        now = time.time()
+        for (task_id, (worker, deadline)) in self.leases.items():
+            if deadline < now:
+                self.retry(task_id)
+
+    def retry(self, task_id):
+        del self.leases[task_id]
+        self.attempts[task_id] += 1
+        if self.attempts[task_id] > self.retries:
+            self.finish(task_id, None)
+        else:
+            self.pending.appendleft(task_id)
+
+    def finish(self, task_id, result):
+        del self.tasks[task_id]
+        self.leases.pop(task_id, None)
+        self.began.pop(task_id, None)
+        self.pending = collections.deque(item for item in self.pending if item != task_id)
+        self.attempts.pop(task_id, None)
+        self.results[task_id] = result
+        self.condition.notify_all()
+
+    def collect(self, task_ids, timeout=None, poll=1.0):
+        # Waits for every task and returns their results, in order; a task
+        # that ran out of retries, or is still out timeout seconds after a
+        # worker first took it, gives None.
+        with self.condition:
+            while True:
+                self.expire()
+                if timeout != None:
+                    now = time.time()
+                    for task_id in task_ids:
+                        if task_id in self.began and now - self.began[task_id] > timeout:
+                            self.finish(task_id, None)
+                if all(task_id in self.results for task_id in task_ids):
+                    break
+                self.condition.wait(poll)
+            return [self.results.pop(task_id) for task_id in task_ids]
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class QueueManager(BaseManager):
+    pass
+
+QueueManager.register("work_queue")
+
+class Coordinator(genome.PopulationEvaluator):
+    # A PopulationEvaluator whose pool is every worker connected to its
+    # address.  Scoring happens on the workers, with their own scorer; the
+    # fitness cache, when given, still runs here.
+    def __init__(self, address=None, authkey=None, batch_size=64, lease=60.0, retries=3,
+                 timeout=None, cache=None, scorer=None):
+        # scorer describes the workers' scorer, for the fitness cache keys
+        genome.PopulationEvaluator.__init__(self, scorer, chunksize=batch_size, timeout=timeout, cache=cache)
+        if authkey == None:
+            if address != None:
+                raise ValueError("a coordinator listening on %s:%d needs an authkey" % address)
+            authkey = os.urandom(16).encode("hex")
+        if address == None:
+            address = ("127.0.0.1", 0)
+        self.authkey = authkey
+        self.stopping = False
+        self.clients = []
+        self.queue = WorkQueue(lease, retries)
+        queue = self.queue
+        class ServerManager(BaseManager):
+            pass
+        ServerManager.register("work_queue", callable=lambda: queue)
+        self.server = ServerManager(address=address, authkey=authkey).get_server()
+        self.address = self.server.address
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        # Accepts workers until close(); Server.serve_forever can not be
+        # stopped.  Each connection is served on its own thread.
+        listener = self.server.listener
+        while True:
+            try:
+                client = listener.accept()
+            except (connection.AuthenticationError, EOFError, IOError):
+                client = None
+            if self.stopping:
+                break
+            if client == None:
+                continue
+            thread = threading.Thread(target=self.server.handle_request, args=(client,))
+            thread.daemon = True
+            thread.start()
+            self.clients = [item for item in self.clients if item.is_alive()] + [thread]
+        listener.close()
+
+    def evaluate_all(self, genomes, known=None):
+        self.evaluations += len(genomes)
+        known_version = None
+        if known != None:
+            known_version = self.queue.share(known)
+        task_ids = []
+        for start in range(0, len(genomes), self.chunksize):
+            (lengths, data) = pack_genomes(genomes[start:start + self.chunksize])
+            task_ids.append(self.queue.put(lengths, data, known_version, instrument.enabled))
+        scores = []
+        keys = []
+        finished = []
+        for (start, result) in zip(range(0, len(genomes), self.chunksize), self.queue.collect(task_ids, self.timeout)):
+            size = len(genomes[start:start + self.chunksize])
+            if result == None:
+                scores.extend([None] * size)
+                keys.extend([None] * size)
+                finished.extend([False] * size)
+                continue
+            (results, timings, chunk_keys, stats) = result
+            scores.extend(results)
+            keys.extend(chunk_keys)
+            finished.extend([True] * size)
+            self.timings.update(timings)
+            if stats != None:
+                instrument.merge(stats)
+        return (scores, keys, finished)
+
+    def close(self, wait=True):
+        # Tells the workers to exit at their next request and stops
+        # listening.  With wait, up to one lease is given for the workers to
+        # disconnect first, since a worker's proxy connects once more on
+        # its way out.  The accept loop is woken with a connection of our own.
+        if self.stopping:
+            return
+        self.queue.close()
+        if wait:
+            deadline = time.time() + self.queue.lease
+            for thread in list(self.clients):
+                thread.join(max(deadline - time.time(), 0))
+        self.stopping = True
+        try:
+            connection.Client(local_address(self.address), authkey=self.authkey).close()
+        except (EOFError, IOError):
+            pass
+        self.thread.join()
+
+def local_address(address):
+    if address[0] in ("", "0.0.0.0"):
+        return ("127.0.0.1", address[1])
+    return address
+
+def worker_name():
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+def run_worker(address, authkey, scorer=None, poll=0.1, genome_class=genome.GearPivotGenome):
+    # Serves one coordinator until it closes or goes away.  Returns the
+    # number of batches scored.
+    if scorer == None:
+        scorer = genome.Scorer()
+    name = worker_name()
+    manager = QueueManager(address=address, authkey=authkey)
+    manager.connect()
+    queue = manager.work_queue()
+    (known_version, known) = (None, None)
+    batches = 0
+    try:
+        while True:
+            task = queue.request(name)
+            if task[0] == "stop":
+                break
+            if task[0] == "wait":
+                time.sleep(poll)
+                continue
+            (kind, task_id, lengths, data, version, profile) = task
+            try:
+                if version != known_version:
+                    (known_version, known) = (version, None)
+                    if version != None:
+                        known = queue.shared(version)
+                genomes = unpack_genomes(lengths, data, genome_class)
+                (scores, timings, keys, stats) = genome.evaluate_chunk(genomes, scorer, known, profile)
+            except Exception as err:
+                queue.fail(name, task_id, repr(err))
+                continue
+            queue.submit(name, task_id, scores, timings, keys, stats)
+            batches += 1
+    except (EOFError, IOError):
+        # the coordinator is gone
+        pass
+    return batches
+
+def run_workers(address, count, authkey, scorer=None):
+    # Starts count worker processes on this host, as for a test run against
+    # a local coordinator.  Returns the processes.
+    address = local_address(address)
+    processes = []
+    for idx in range(count):
+        process = multiprocessing.Process(target=run_worker, args=(address, authkey, scorer))
+        process.daemon = True
+        process.start()
+        processes.append(process)
+    return processes
@@ -0,0 +1,59 @@
+__all__ = ["GraphViz"]
+
+import hashlib
+import os
+from concurrent import futures
+from graph import DirectedGraph
+
+class GraphViz(object):
+    # Node ids are node names and nodes and edges are emitted in sorted
+    # order, so the same graph always produces the same dot source; its
+    # hash names the output in render_many.
+    def __init__(self, format="png"):
+        self.format = format
+
+    def source(self, graph):
+        import graphviz
+        directed = isinstance(graph, DirectedGraph)
+        if directed:
+            dot = graphviz.Digraph(format=self.format)
+        else:
+            dot = graphviz.Graph(format=self.format)
+        visited = set()
+        nodes = sorted(graph, key=lambda node: node.name)
+        for node in nodes:
+            dot.node(node.name, label=node.name)
+        for node in nodes:
+            for n_node in sorted(graph[node], key=lambda node: node.name):
+                if directed or (n_node, node) not in visited:
+                    dot.edge(node.name, n_node.name, label=str(graph[node][n_node]))
+                    visited.add((node, n_node))
+        return dot
+
+    def digest(self, dot):
+        return hashlib.sha1(dot.source).hexdigest()
+
+    def render(self, graph, filename="graph_dot"):
+        return self.source(graph).render(filename)
+
+    def render_many(self, graphs, directory=".", workers=4):
+        # Renders every graph to <directory>/<hash of its dot source>, in a
+        # thread pool (the work happens in dot subprocesses).  Graphs whose
+        # output already exists, and repeats within the batch, are not
+        # rendered again.  Returns the output path of each graph.
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        outputs = []
+        jobs = {}
+        for graph in graphs:
+            dot = self.source(graph)
+            filename = os.path.join(directory, self.digest(dot))
+            output = "%s.%s" % (filename, self.format)
+            outputs.append(output)
+            if output not in jobs and not os.path.exists(output):
+                jobs[output] = (dot, filename)
+        with futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            rendered = [pool.submit(dot.render, filename) for (dot, filename) in jobs.values()]
+            for job in rendered:
+                job.result()
+        return outputs
@@ -0,0 +1,174 @@
+import numpy
+import time
+
+from . import genome
+
+class Evolver(object):
+    # A generational genetic algorithm over a (population_size, genome_length)
+    # uint32 gene matrix.  Selection and crossover operators are chosen by
+    # name and looked up as select_<name> and crossover_<name>.  Fitness is
+    # maximized; genomes that score None never win a selection.
+    def __init__(self, evaluator=None, population_size=100, genome_length=200,
+                 selection="tournament", crossover="one_point", tournament_size=3,
+                 crossover_rate=0.9, mutation_rate=0.01, elitism=2, seed=None,
+                 genome_class=genome.GearPivotGenome):
+        if evaluator == None:
+            evaluator = genome.PopulationEvaluator()
+        self.evaluator = evaluator
+        if not 0 <= elitism < population_size:
+            raise ValueError("elitism must be at least 0 and below population_size (%d), not %d"
+                             % (population_size, elitism))
+        self.population_size = population_size
+        self.genome_length = genome_length
+        self.select = self.operator("select", selection, "selection")
+        self.crossover = self.operator("crossover", crossover, "crossover")
+        self.tournament_size = tournament_size
+        self.crossover_rate = crossover_rate
+        self.mutation_rate = mutation_rate
+        self.elitism = elitism
+        self.random = numpy.random.RandomState(seed)
+        self.genome_class = genome_class
+        self.genes = None
+        self.fitness = None
+        self.generation = 0
+        self.history = []
+        self.best = None
+
+    def operator(self, prefix, name, label):
+        # the <prefix>_<name> method, or a ValueError naming the choices
+        method = getattr(self, "%s_%s" % (prefix, name), None)
+        if method == None:
+            names = sorted(attribute[len(prefix) + 1:] for attribute in dir(self) if attribute.startswith(prefix + "_"))
+            raise ValueError("unknown %s %r; choose one of %s" % (label, name, ", ".join(names)))
+        return method
+
+    def random_genes(self, shape):
+        return self.genome_class.random_genes(shape, self.random)
+
+    def genomes(self, genes=None):
+        if genes is None:
+            genes = self.genes
+        return [self.genome_class(row) for row in genes]
+
+    ####
+    ## Selection
+    def select_tournament(self, fitness, count):
+        entrants = self.random.randint(0, len(fitness), size=(count, self.tournament_size))
+        winners = numpy.argmax(fitness[entrants], axis=1)
+        return entrants[numpy.arange(count), winners]
+
+    def select_roulette(self, fitness, count):
+        # Weights are fitness above the lowest finite fitness; genomes that
+        # scored None (-inf) get no weight.
+        finite = numpy.isfinite(fitness)
+        if not finite.any():
+            return self.random.randint(0, len(fitness), size=count)
+        weights = numpy.zeros(len(fitness))
+        weights[finite] = fitness[finite] - fitness[finite].min()
+        total = weights.sum()
+        if total <= 0:
+            candidates = numpy.flatnonzero(finite)
+            return candidates[self.random.randint(0, len(candidates), size=count)]
+        return self.random.choice(len(fitness), size=count, p=weights / total)
+
+    ####
+    ## Crossover
+    def crossover_one_point(self, genes_a, genes_b):
+        (count, length) = genes_a.shape
+        cuts = self.random.randint(1, length, size=(count, 1))
+        mask = numpy.arange(length) < cuts
+        return numpy.where(mask, genes_a, genes_b)
+
+    def crossover_two_point(self, genes_a, genes_b):
+        (count, length) = genes_a.shape
+        cuts = numpy.sort(self.random.randint(0, length + 1, size=(count, 2)), axis=1)
+        columns = numpy.arange(length)
+        mask = (columns < cuts[:, :1]) | (columns >= cuts[:, 1:])
+        return numpy.where(mask, genes_a, genes_b)
+
+    def crossover_uniform(self, genes_a, genes_b):
+        mask = self.random.random_sample(genes_a.shape) < 0.5
+        return numpy.where(mask, genes_a, genes_b)
+
+    ####
+    ## Mutation
+    def mutate(self, genes):
+        # replaces each gene with a fresh random value at mutation_rate
+        mask = self.random.random_sample(genes.shape) < self.mutation_rate
+        genes[mask] = self.random_genes(int(mask.sum()))
+        return genes
+
+    ####
+    ## Generations
+    def initialize(self, genes=None):
+        # Starts from genes, cut down to population_size or topped up with
+        # random genomes, or from a random population.
+        if genes is None:
+            genes = self.random_genes((self.population_size, self.genome_length))
+        genes = numpy.asarray(genes, dtype=numpy.uint32)[:self.population_size]
+        if len(genes) < self.population_size:
+            extra = self.random_genes((self.population_size - len(genes), genes.shape[1]))
+            genes = numpy.concatenate((genes, extra))
+        self.genes = genes
+        self.fitness = None
+        self.generation = 0
+
+    def evaluate(self):
+        scores = self.evaluator.evaluate(self.genomes())
+        fitness = numpy.array([-numpy.inf if score == None else score for score in scores], dtype=float)
+        self.fitness = fitness
+        return fitness
+
+    def breed(self):
+        count = len(self.genes) - self.elitism
+        parents_a = self.genes[self.select(self.fitness, count)]
+        parents_b = self.genes[self.select(self.fitness, count)]
+        children = self.crossover(parents_a, parents_b)
+        keep = self.random.random_sample(count) >= self.crossover_rate
+        children[keep] = parents_a[keep]
+        children = self.mutate(children)
+        elite = self.genes[numpy.argsort(self.fitness)[::-1][:self.elitism]]
+        return numpy.concatenate((elite, children))
+
+    def step(self):
+        # Evaluates the current generation, records its statistics and
+        # replaces it with the next one.  Returns the statistics.
+        if self.genes is None:
+            self.initialize()
+        self.evaluator.reset_stats()
+        started = time.time()
+        fitness = self.evaluate()
+        elapsed = time.time() - started
+        stats = self.report(fitness, elapsed)
+        self.history.append(stats)
+        self.best = (self.genome_class(self.genes[numpy.argmax(fitness)].copy()), fitness.max())
+        self.genes = self.breed()
+        self.generation += 1
+        return stats
+
+    def report(self, fitness, elapsed):
+        evaluations = self.evaluator.evaluations
+        timings = self.evaluator.timings
+        stage_total = float(sum(timings.values())) or 1.0
+        scored = fitness[numpy.isfinite(fitness)]
+        stats = {
+            "generation": self.generation,
+            "population": len(fitness),
+            "scored": len(scored),
+            "best": float(scored.max()) if len(scored) else None,
+            "mean": float(scored.mean()) if len(scored) else None,
+            "evaluations": evaluations,
+            "seconds": elapsed,
+            "evaluations_per_second": evaluations / elapsed if elapsed else 0.0,
+        }
+        for stage in ("decode", "simulate", "score"):
+            stats["%s_seconds" % stage] = timings[stage]
+            stats["%s_fraction" % stage] = timings[stage] / stage_total
+        return stats
+
+    def run(self, generations, callback=None):
+        for x in range(generations):
+            stats = self.step()
+            if callback != None:
+                callback(stats)
+        return self.history
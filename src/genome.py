@@ -1,9 +1,22 @@
+import bisect
+import collections
+import copy
+import errno
+import hashlib
 import math
-import random
+import multiprocessing
+import numpy
+import os
+import time
+from multiprocessing import queues
 
+from . import cache
 from . import graph
+from . import instrument
 
 class Gene(object):
+    Parameters = ()
+
     def __init__(self, **kw):
         self.__dict__.update(kw)
         self.world = None
@@ -22,6 +35,9 @@ class Gene(object):
     def express(self):
         pass
 
+    def parameters(self):
+        return tuple(getattr(self, key, None) for key in self.Parameters)
+
     def children(self, visited):
         nodes = set(self.graph[self])
         to_visit = nodes - visited
@@ -29,7 +45,7 @@ class Gene(object):
         return iter(to_visit)
 
 class PivotGene(Gene):
-    pass
+    Parameters = ("position", "angle", "radius")
 
 class PivotGearGene(PivotGene):
     def express(self, graph, world):
@@ -40,7 +56,10 @@ class PivotLinkageGene(PivotGene):
         pass
 
 class GearGene(Gene):
+    Parameters = ("number_of_teeth", "module")
+
     def embed_body(self, world):
+        import pymunk
         self.body = pymunk.Body(1, 1)
         self.body.position = self.position
         self.circle = pymunk.Circle(self.body, self._gear.pitch_radius)
@@ -65,6 +84,7 @@ class MotorGene(GearGene):
     position = property(get_position)
 
     def embed_body(self, world):
+        import pymunk
         super(Motor, self).embed_body(world)
         motor_joint = pymunk.constraint.SimpleMotor(self.static_body, self.body, 10)
         world.add([motor_joint])
@@ -74,6 +94,7 @@ class LinkageGene(Gene):
         pass
 
     def embed_body(self, world):
+        import pymunk
         self.body = pymunk.Body(1, 1)
         self.body.position = self.center
         self.body.angle = self.angle
@@ -85,21 +106,70 @@ class LinkageGene(Gene):
         world.add(self.body, self.segment)
 
     def embed_pivot(self, world, linkage):
-        print "linking %s to %s." % (self.name, linkage.name)
-        print self.pivot_points[linkage]
+        import pymunk
+        instrument.count("embed.pivot_joints")
         joint = pymunk.constraint.PivotJoint(self.body, linkage.body, self.pivot_points[linkage])
         world.add(joint)
 
 
 
+class GeneStream(object):
+    # An iterator over genes that knows how many it has handed out, so the
+    # parser can tell where each command starts.
+    def __init__(self, genes, offset=0):
+        self.genes = genes
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            value = self.genes[self.offset]
+        except IndexError:
+            raise StopIteration
+        self.offset += 1
+        return value
+
 class Specie(object):
     DefaultRules = {}
+    Grammar = {}
+    CompiledGrammars = {}
 
     def __init__(self, rules=None):
         if rules == None:
             rules = {}
         self.rules = self.DefaultRules.copy()
         self.rules.update(rules)
+        self.dispatch = {}
+        self.checkpoints = []
+        self.checkpoint_interval = None
+        self.parameters = None
+        self.pending_parameters = []
+
+    @classmethod
+    def compile_grammar(cls, domain):
+        # Flattens the grammar below domain into nested tuples indexed by
+        # gene value modulo their length, with handler names at the leaves.
+        # The result is cached per class and per domain.
+        key = (cls, domain)
+        if key not in cls.CompiledGrammars:
+            if domain in cls.Grammar:
+                choices = cls.Grammar[domain]
+                table = tuple(cls.compile_grammar("%s_%s" % (domain, choice)) for choice in choices)
+            else:
+                table = domain
+            cls.CompiledGrammars[key] = table
+        return cls.CompiledGrammars[key]
+
+    def bind_grammar(self, table):
+        # With instrumentation enabled, each handler is timed per rule.
+        if type(table) is tuple:
+            return tuple(self.bind_grammar(entry) for entry in table)
+        handler = getattr(self, table)
+        if instrument.enabled:
+            handler = instrument.timed("parse.%s" % table, handler)
+        return handler
 
     def scale(self, genome, max_val=1, min_val=0):
         return (genome.next() / float(self.rules["max_value"])) * (max_val - min_val) + min_val
@@ -113,26 +183,199 @@ class Specie(object):
         return choices[idx]
 
     def execute(self, domain, genome):
-        while domain in self.Grammar:
-            choices = self.Grammar[domain]
-            choice = self.select(genome, choices)
-            domain = "%s_%s" % (domain, choice)
-        func = getattr(self, domain)
-        func(genome)
-
-    def parse(self, genome):
-        genome = iter(genome)
+        if domain not in self.dispatch:
+            self.dispatch[domain] = self.bind_grammar(self.compile_grammar(domain))
+        table = self.dispatch[domain]
+        while type(table) is tuple:
+            table = table[genome.next() % len(table)]
+        table(genome)
+
+    def parse(self, genome, checkpoint_interval=None, track_parameters=False):
+        # With checkpoint_interval, a snapshot of the specie is recorded at
+        # the first command boundary at or after every checkpoint_interval
+        # genes, so that resume() can re-decode a mutated genome from there.
+        # With track_parameters, the offset of every gene that only sets a
+        # numeric value is recorded, so that update_parameters() can apply
+        # mutations of those genes without re-decoding.
+        if checkpoint_interval != None or track_parameters:
+            self.checkpoints = []
+            self.checkpoint_interval = checkpoint_interval
+            if track_parameters:
+                self.parameters = {}
+            with instrument.timer("parse"):
+                self.parse_stream(GeneStream(list(genome)))
+            return
+        with instrument.timer("parse"):
+            genome = iter(genome)
+            execute = self.execute
+            try:
+                while genome:
+                    try:
+                        execute("command", genome)
+                    except ZeroDivisionError:
+                        pass
+            except StopIteration:
+                pass
+
+    def parse_stream(self, stream):
+        execute = self.execute
+        interval = self.checkpoint_interval
+        next_checkpoint = stream.offset
+        if interval == None:
+            next_checkpoint = float("inf")
+        tracking = self.parameters != None
         try:
-            while genome:
+            while stream:
+                if stream.offset >= next_checkpoint:
+                    self.checkpoints.append((stream.offset, self.snapshot()))
+                    next_checkpoint = stream.offset + interval
+                if tracking:
+                    self.pending_parameters = []
                 try:
-                    self.execute("command", genome)
+                    execute("command", stream)
                 except ZeroDivisionError:
                     pass
         except StopIteration:
             pass
 
-class Genome(list):
-    pass
+    def resume(self, genome, changed_offset):
+        # Decodes genome, which only differs from the genome this specie
+        # parsed (with checkpoints) from gene changed_offset on, into a new
+        # specie.  Decoding restarts from the last checkpoint before the
+        # change, and the new specie shares the earlier checkpoints.  With no
+        # such checkpoint, as after parsing without checkpoint_interval, the
+        # genome is parsed from the start.
+        offsets = [offset for (offset, state) in self.checkpoints]
+        idx = bisect.bisect_right(offsets, changed_offset) - 1
+        specie = self.__class__(rules=self.rules)
+        if idx < 0:
+            specie.parse(genome, self.checkpoint_interval, self.parameters != None)
+            return specie
+        (offset, state) = self.checkpoints[idx]
+        specie.checkpoints = self.checkpoints[:idx]
+        specie.checkpoint_interval = self.checkpoint_interval
+        if self.parameters != None:
+            specie.parameters = dict((key, entry) for (key, entry) in self.parameters.iteritems() if key < offset)
+        specie.restore(state)
+        specie.parse_stream(GeneStream(list(genome), offset))
+        return specie
+
+    def parameter(self, genome, key, decoder, *args):
+        # Decodes a parametric gene: one that only sets attribute key (or
+        # item key[1] of attribute key[0]) of the next node the command adds
+        # with bind_parameters.  Parametric genes never change the topology.
+        value = decoder(genome, *args)
+        if self.parameters != None:
+            entry = [None, key, decoder, args]
+            self.parameters[genome.offset - 1] = entry
+            self.pending_parameters.append(entry)
+        return value
+
+    def bind_parameters(self, node):
+        for entry in self.pending_parameters:
+            entry[0] = node
+        self.pending_parameters = []
+
+    def update_parameters(self, genome, changed):
+        # Applies a mutation that only touched the genes at offsets changed,
+        # reusing the decoded (and normalized) graph.  Returns False, without
+        # changing anything, if any of those genes is structural; the genome
+        # then needs a full parse.  Updated genes are copied before they
+        # change, since checkpoints and resumed species share them, and the
+        # checkpoints taken after the first changed gene are dropped.
+        if self.parameters == None:
+            return False
+        for offset in changed:
+            if offset not in self.parameters:
+                return False
+        copies = {}
+        for offset in changed:
+            (node, key, decoder, args) = self.parameters[offset]
+            if node == None:
+                # the gene was read by a command that added nothing
+                continue
+            if node not in copies:
+                copies[node] = copy.copy(node)
+            node = copies[node]
+            value = decoder(iter((genome[offset],)), *args)
+            if type(key) is tuple:
+                (key, idx) = key
+                values = list(getattr(node, key))
+                values[idx] = value
+                value = tuple(values)
+            setattr(node, key, value)
+        for (offset, entry) in self.parameters.items():
+            if entry[0] in copies:
+                self.parameters[offset] = [copies[entry[0]]] + entry[1:]
+        for (node, new_node) in copies.items():
+            self.replace_node(node, new_node)
+        first = min(changed)
+        self.checkpoints = [(offset, state) for (offset, state) in self.checkpoints if offset <= first]
+        return True
+
+    def replace_node(self, node, new_node):
+        # Subclasses put new_node in the place of node in their own state.
+        pass
+
+    def snapshot(self):
+        # Subclasses return a copy of their decoding state.
+        return {}
+
+    def restore(self, state):
+        pass
+
+def random_state(seed=None):
+    if seed == None:
+        return numpy.random
+    if isinstance(seed, numpy.random.RandomState):
+        return seed
+    return numpy.random.RandomState(seed)
+
+class Genome(object):
+    # Genes are stored as a uint32 array.  Wrapping an existing uint32 array
+    # (or a row of one, or a memory map) does not copy it.
+    def __init__(self, genes=()):
+        self.genes = numpy.asarray(genes, dtype=numpy.uint32)
+
+    def __len__(self):
+        return len(self.genes)
+
+    def __iter__(self):
+        # tolist unboxes every gene in a single C loop, which is much
+        # cheaper than producing a numpy scalar per gene.  Widening first
+        # yields plain ints rather than longs.
+        return iter(self.genes.astype(int).tolist())
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.__class__(self.genes[idx])
+        return int(self.genes[idx])
+
+    def __eq__(self, other):
+        return isinstance(other, Genome) and numpy.array_equal(self.genes, other.genes)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def copy(self):
+        return self.__class__(self.genes.copy())
+
+    def first_difference(self, other):
+        # the offset of the first gene where the genomes differ, or None
+        length = min(len(self), len(other))
+        changed = numpy.flatnonzero(self.genes[:length] != other.genes[:length])
+        if len(changed):
+            return int(changed[0])
+        if len(self) != len(other):
+            return length
+        return None
+
+    def changed_genes(self, other):
+        # the offsets where two genomes of equal length differ
+        assert len(self) == len(other)
+        return numpy.flatnonzero(self.genes != other.genes).tolist()
 
 class GearPivotSpecie(Specie):
     Grammar = {
@@ -157,29 +400,83 @@ class GearPivotSpecie(Specie):
         self.linkage_pivots = []
         self.gear_pivots = []
         self.graph = graph.BidirectedGraph()
+        # Connectivity is kept up to date as the graph is built: gear_sets
+        # tracks gear trains, part_sets tracks the pivot/linkage assemblies,
+        # and pivot_gears records which gear each gear pivot sits on.
+        self.gear_sets = graph.DisjointSet()
+        self.part_sets = graph.DisjointSet()
+        self.pivot_gears = {}
+
+    def snapshot(self):
+        return {
+            "gears": self.gears[:],
+            "linkages": self.linkages[:],
+            "linkage_pivots": self.linkage_pivots[:],
+            "gear_pivots": self.gear_pivots[:],
+            "graph": self.graph.copy(),
+            "gear_sets": self.gear_sets.copy(),
+            "part_sets": self.part_sets.copy(),
+            "pivot_gears": self.pivot_gears.copy(),
+        }
+
+    def restore(self, state):
+        # copies again, so the checkpoint can be restored more than once
+        self.gears = state["gears"][:]
+        self.linkages = state["linkages"][:]
+        self.linkage_pivots = state["linkage_pivots"][:]
+        self.gear_pivots = state["gear_pivots"][:]
+        self.graph = state["graph"].copy()
+        self.gear_sets = state["gear_sets"].copy()
+        self.part_sets = state["part_sets"].copy()
+        self.pivot_gears = state["pivot_gears"].copy()
+
+    def replace_node(self, node, new_node):
+        if node in self.graph:
+            self.graph.replace_node(node, new_node)
+        for nodes in (self.gears, self.linkages, self.linkage_pivots, self.gear_pivots):
+            for (idx, item) in enumerate(nodes):
+                if item is node:
+                    nodes[idx] = new_node
+        for sets in (self.gear_sets, self.part_sets):
+            if node in sets:
+                sets.replace(node, new_node)
+        if node in self.pivot_gears:
+            self.pivot_gears[new_node] = self.pivot_gears.pop(node)
+        for (pivot, gear) in self.pivot_gears.items():
+            if gear is node:
+                self.pivot_gears[pivot] = new_node
+        # linkages name their pivots, so they are copied as well
+        for linkage in list(self.linkages):
+            if linkage.pivot_a is node or linkage.pivot_b is node:
+                new_linkage = copy.copy(linkage)
+                if linkage.pivot_a is node:
+                    new_linkage.pivot_a = new_node
+                if linkage.pivot_b is node:
+                    new_linkage.pivot_b = new_node
+                self.replace_node(linkage, new_linkage)
 
     ####
     ## Genome Parsers
     def command_add_gear(self, genome):
-        teeth = self.modulo(genome, self.rules["min_gear_teeth"], self.rules["max_gear_teeth"])
+        teeth = self.parameter(genome, "number_of_teeth", self.modulo, self.rules["min_gear_teeth"], self.rules["max_gear_teeth"])
         self.add_gear(number_of_teeth=teeth)
 
     def command_add_linkage_pivot(self, genome):
-        x_position = self.scale(genome)
-        y_position = self.scale(genome)
+        x_position = self.parameter(genome, ("position", 0), self.scale)
+        y_position = self.parameter(genome, ("position", 1), self.scale)
         position = (x_position, y_position)
         self.add_linkage_pivot(position=position)
 
     def command_add_gear_pivot(self, genome):
         gear = self.select(genome, self.gears)
-        angle = self.scale(genome, math.pi * 2)
-        radius = self.scale(genome)
+        angle = self.parameter(genome, "angle", self.scale, math.pi * 2)
+        radius = self.parameter(genome, "radius", self.scale)
         self.add_gear_pivot(gear=gear, angle=angle, radius=radius)
 
     def command_link_gear_to_gear(self, genome):
         gear_a = self.select(genome, self.gears)
         gear_b = self.select(genome, self.gears)
-        angle = self.scale(genome, math.pi * 2)
+        angle = self.parameter(genome, "angle", self.scale, math.pi * 2)
         self.link_gear_to_gear(gear_a=gear_a, gear_b=gear_b, angle=angle)
 
     def command_link_gear_pivot_to_linkage_pivot(self, genome):
@@ -200,8 +497,10 @@ class GearPivotSpecie(Specie):
         kw["module"] = module
         kw["name"] = name
         gear = GearGene(**kw)
+        self.bind_parameters(gear)
         self.gears.append(gear)
         self.graph.add_node(gear)
+        self.gear_sets.add(gear)
 
     def add_linkage(self, **kw):
         name = "linkage-%d" % len(self.linkages)
@@ -209,27 +508,34 @@ class GearPivotSpecie(Specie):
         linkage = LinkageGene(**kw)
         self.linkages.append(linkage)
         self.graph.add_node(linkage)
+        self.part_sets.add(linkage)
         return linkage
 
     def add_linkage_pivot(self, **kw):
         name = "linkage_pivot-%d" % len(self.linkage_pivots)
         kw["name"] = name
         pivot = PivotGene(**kw)
+        self.bind_parameters(pivot)
         self.linkage_pivots.append(pivot)
         self.graph.add_node(pivot)
+        self.part_sets.add(pivot)
 
     def add_gear_pivot(self, gear=None, **kw):
         name = "gear_pivot-%d" % len(self.gear_pivots)
         kw["name"] = name
         pivot = PivotGene(**kw)
+        self.bind_parameters(pivot)
         self.gear_pivots.append(pivot)
         self.graph.add_node(pivot)
         self.graph.connect(gear, pivot)
+        self.part_sets.add(pivot)
+        self.pivot_gears[pivot] = gear
 
     def link_gear_to_gear(self, gear_a=None, gear_b=None, **kw):
         if gear_a == gear_b:
             return
         self.graph.connect(gear_a, gear_b)
+        self.gear_sets.union(gear_a, gear_b)
 
     def link_gear_pivot_to_linkage_pivot(self, pivot_a=None, pivot_b=None, **kw):
         if pivot_a == pivot_b:
@@ -237,6 +543,8 @@ class GearPivotSpecie(Specie):
         linkage = self.add_linkage(pivot_a=pivot_a, pivot_b=pivot_b)
         self.graph.connect(pivot_a, linkage)
         self.graph.connect(linkage, pivot_b)
+        self.part_sets.union(pivot_a, linkage)
+        self.part_sets.union(linkage, pivot_b)
 
     def link_linkage_pivot_to_linkage_pivot(self, pivot_a=None, pivot_b=None, **kw):
         if pivot_a == pivot_b:
@@ -244,39 +552,345 @@ class GearPivotSpecie(Specie):
         linkage = self.add_linkage(pivot_a=pivot_a, pivot_b=pivot_b)
         self.graph.connect(pivot_a, linkage)
         self.graph.connect(linkage, pivot_b)
+        self.part_sets.union(pivot_a, linkage)
+        self.part_sets.union(linkage, pivot_b)
 
     def normalize_graph(self):
-        motor = self.gears[0]
-        connected_gears = self.bfs_walk(motor, kind=GearGene)
-        all_gears = set(self.gears)
-        disjoint_gears = all_gears - connected_gears
-        for node in disjoint_gears:
-            self.graph.remove_node(node)
-        #
-        connected_nodes = self.bfs_walk(motor)
-        all_nodes = set(self.graph.keys())
-        disjoint_nodes = all_nodes - connected_nodes
-        for node in disjoint_nodes:
-            self.graph.remove_node(node)
-
-    def bfs_walk(self, node, kind=None, visited=None):
-        if visited == None:
-            visited = set()
-        visited.add(node)
-        for node in self.graph[node]:
-            if kind != None and not isinstance(node, kind):
-                continue
-            if node in visited:
-                continue
-            visited = self.bfs_walk(node, visited=visited)
+        # Drops every gear outside the motor's gear train, then every
+        # assembly that is not attached to a remaining gear.
+        with instrument.timer("normalize_graph"):
+            motor = self.gears[0]
+            train = self.gear_sets.find(motor)
+            gears = set(gear for gear in self.gears if self.gear_sets.find(gear) == train)
+            attached = set()
+            for (pivot, gear) in self.pivot_gears.iteritems():
+                if gear in gears:
+                    attached.add(self.part_sets.find(pivot))
+            for node in list(self.graph):
+                if isinstance(node, GearGene):
+                    if node in gears:
+                        continue
+                elif self.part_sets.find(node) in attached:
+                    continue
+                self.graph.remove_node(node)
+
+    def bfs_walk(self, node, kind=None):
+        visited = set([node])
+        queue = collections.deque([node])
+        while queue:
+            node = queue.popleft()
+            for neighbor in self.graph[node]:
+                if kind != None and not isinstance(neighbor, kind):
+                    continue
+                if neighbor in visited:
+                    continue
+                visited.add(neighbor)
+                queue.append(neighbor)
         return visited
 
 class GearPivotGenome(Genome):
     SpecieClass = GearPivotSpecie
 
     @classmethod
-    def random_genome(cls, length=100):
+    def random_genes(cls, shape, seed=None):
         max_val = cls.SpecieClass.DefaultRules["max_value"]
-        genome = [random.randint(0, max_val) for x in range(length)]
-        return cls(genome)
+        return random_state(seed).randint(0, max_val + 1, size=shape, dtype=numpy.uint32)
+
+    @classmethod
+    def random_genome(cls, length=100, seed=None):
+        return cls(cls.random_genes(length, seed))
 
+    @classmethod
+    def random_population(cls, count, length=100, seed=None):
+        # all genomes are views into one contiguous (count, length) block
+        genes = cls.random_genes((count, length), seed)
+        return [cls(row) for row in genes]
+
+
+class Scorer(object):
+    # Turns a parsed and normalized specie into a fitness score.  Subclasses
+    # embed and simulate the specie in simulate() and reduce the result to a
+    # number in score().  The base class only looks at the structure, and
+    # scores a specie by the number of linkages still connected to its motor.
+    # Settings names the attributes that change the scores; subclasses with
+    # settings of their own add them, as the fitness cache tells scorers
+    # apart by them.
+    Settings = ("steps",)
+
+    def __init__(self, steps=None):
+        # steps is the simulation step budget, for scorers that simulate
+        self.steps = steps
+
+    def simulate(self, specie):
+        return None
+
+    def score(self, specie, result):
+        return sum(1 for node in specie.graph if isinstance(node, LinkageGene))
+
+    def __call__(self, specie):
+        return self.score(specie, self.simulate(specie))
+
+    def fingerprint(self):
+        # Names the scorer and its Settings, so cached scores are only
+        # reused by the same scorer, in this process or a later one.
+        cls = self.__class__
+        digest = hashlib.sha1("%s.%s" % (cls.__module__, cls.__name__))
+        for name in self.Settings:
+            digest.update(_setting_bytes(name))
+            digest.update(_setting_bytes(getattr(self, name)))
+        return digest.hexdigest()[:12]
+
+def _setting_bytes(value):
+    # A length prefixed encoding of a setting that is the same in every
+    # process: arrays by their contents, containers item by item, anything
+    # else by a repr that must not name a memory address.
+    if isinstance(value, numpy.ndarray):
+        text = "array%s%r%s" % (value.dtype.str, value.shape, numpy.ascontiguousarray(value).tostring())
+    elif isinstance(value, (tuple, list)):
+        text = "seq" + "".join(_setting_bytes(item) for item in value)
+    elif isinstance(value, dict):
+        text = "map" + "".join(_setting_bytes(key) + _setting_bytes(value[key]) for key in sorted(value))
+    else:
+        text = repr(value)
+        if " at 0x" in text:
+            raise ValueError("scorer setting %s has no stable repr; override fingerprint" % text)
+    return "%d:%s" % (len(text), text)
+
+def decode_genome(genome):
+    specie = genome.SpecieClass()
+    specie.parse(genome)
+    if not specie.gears:
+        return None
+    specie.normalize_graph()
+    return specie
+
+def mechanism_key(genome):
+    specie = decode_genome(genome)
+    if specie == None:
+        return None
+    return cache.canonical_hash(specie)
+
+def genome_key(genome):
+    return hashlib.sha1(numpy.asarray(genome.genes, dtype=numpy.uint32).tostring()).hexdigest()
+
+def feasible_score(value):
+    # a cached result as a score, Infeasible being None
+    if value == cache.Infeasible:
+        return None
+    return value
+
+def evaluate_genome(genome, scorer, timings=None, known=None):
+    # Returns (score, key).  With known, a set of mechanism keys whose
+    # scores the caller already has, key is the genome's mechanism key and
+    # a known mechanism is not simulated: its score is left None for the
+    # caller to fill in.  Without known, key is None.  timings, when given,
+    # accumulates seconds spent in each stage.
+    if timings == None:
+        timings = collections.Counter()
+    started = time.time()
+    specie = decode_genome(genome)
+    key = None
+    if specie != None and known != None:
+        key = cache.canonical_hash(specie)
+    decoded = time.time()
+    timings["decode"] += decoded - started
+    if specie == None:
+        return (None, None)
+    if key != None and key in known:
+        return (None, key)
+    try:
+        result = scorer.simulate(specie)
+        simulated = time.time()
+        timings["simulate"] += simulated - decoded
+        score = scorer.score(specie, result)
+        timings["score"] += time.time() - simulated
+    except ValueError:
+        # the mechanism can not be assembled
+        return (None, key)
+    return (score, key)
+
+def evaluate_chunk(genomes, scorer, known=None, profile=False):
+    # Returns (scores, timings, keys, stats); see evaluate_genome.  With
+    # profile, stats holds the instrument stats of this chunk, recorded in
+    # whichever process ran it, for the caller to merge; otherwise None.
+    if profile:
+        (result, stats) = instrument.capture(evaluate_chunk, genomes, scorer, known)
+        return result[:3] + (stats,)
+    timings = collections.Counter()
+    results = [evaluate_genome(genome, scorer, timings, known) for genome in genomes]
+    scores = [score for (score, key) in results]
+    keys = [key for (score, key) in results]
+    return (scores, dict(timings), keys, None)
+
+# In pool workers, where run_chunk reports the chunks it starts.
+_started = None
+
+def _init_worker(started):
+    global _started
+    _started = started
+
+def run_chunk(task, genomes, scorer, known=None, profile=False):
+    # evaluate_chunk as a pool task, after telling the evaluator which
+    # worker started it and when
+    if _started != None:
+        _started.put((task, multiprocessing.current_process().pid, time.time()))
+    return evaluate_chunk(genomes, scorer, known, profile)
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno != errno.ESRCH
+    return True
+
+class PopulationEvaluator(object):
+    # With timeout, a chunk scores None once it has run that many seconds
+    # on a worker; time spent queued behind other chunks does not count.
+    # Workers running late chunks are killed once the batch is over.
+    Poll = 0.05
+
+    def __init__(self, scorer=None, workers=None, chunksize=16, timeout=None, cache=None):
+        if scorer == None:
+            scorer = Scorer()
+        self.scorer = scorer
+        self.cache = cache
+        self.workers = workers
+        self.chunksize = chunksize
+        self.timeout = timeout
+        self.fingerprint = scorer.fingerprint()
+        self.pool = None
+        self.started = None
+        self.next_task = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        # evaluations counts genomes sent to the pool; timings sums the
+        # seconds every worker spent per stage
+        self.evaluations = 0
+        self.timings = collections.Counter()
+
+    def get_pool(self):
+        if self.pool == None:
+            # written synchronously, as a worker may die right after
+            self.started = queues.SimpleQueue()
+            self.pool = multiprocessing.Pool(self.workers, _init_worker, (self.started,))
+        return self.pool
+
+    def close(self, wait=True):
+        # without wait, chunks still running are killed
+        if self.pool != None:
+            if wait:
+                self.pool.close()
+            else:
+                self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            self.started = None
+
+    def evaluate(self, genomes):
+        # Returns one score per genome, in order.  Genomes that fail to
+        # decode, can not be assembled, or whose chunk timed out or lost its
+        # worker score None.
+        if self.cache == None:
+            return self.evaluate_all(genomes)[0]
+        # Genomes and mechanisms are cached in two namespaces under the
+        # scorer's fingerprint.  Genomes seen before are looked up here by
+        # their genes; the rest go to the workers with the keys of the
+        # cached mechanisms, and the score of a known mechanism a worker
+        # decodes is filled in here.  Results that can not be scored are
+        # cached as Infeasible; genomes that timed out are not cached.
+        # Duplicates within the batch count as cache hits.
+        genome_prefix = "%s:genome:" % self.fingerprint
+        mechanism_prefix = "%s:mechanism:" % self.fingerprint
+        scores = [None] * len(genomes)
+        pending = collections.OrderedDict()
+        for (idx, genome) in enumerate(genomes):
+            key = genome_prefix + genome_key(genome)
+            if key in pending:
+                self.cache.record(True)
+                pending[key].append(idx)
+                continue
+            score = self.cache.lookup(key)
+            if score != None:
+                self.cache.record(True)
+                scores[idx] = feasible_score(score)
+                continue
+            pending[key] = [idx]
+        unique = [genomes[indices[0]] for indices in pending.values()]
+        known = self.cache.keys(mechanism_prefix)
+        (results, keys, finished) = self.evaluate_all(unique, known)
+        # known mechanisms are read back before anything is put, so none
+        # of them is trimmed in between
+        reused = {}
+        for mechanism in set(keys) & known:
+            score = self.cache.lookup(mechanism_prefix + mechanism)
+            if score != None:
+                reused[mechanism] = score
+        for ((key, indices), score, mechanism, done) in zip(pending.items(), results, keys, finished):
+            if mechanism in reused:
+                self.cache.record(True)
+                value = reused[mechanism]
+            else:
+                self.cache.record(False)
+                if not done or mechanism in known:
+                    continue
+                value = cache.Infeasible if score == None else score
+                if mechanism != None:
+                    self.cache.put(mechanism_prefix + mechanism, value)
+            self.cache.put(key, value)
+            for idx in indices:
+                scores[idx] = feasible_score(value)
+        return scores
+
+    def evaluate_all(self, genomes, known=None):
+        # Returns (scores, keys, finished): scores and keys as evaluate_chunk
+        # returns them, and whether each genome's chunk finished.
+        scores = [None] * len(genomes)
+        keys = [None] * len(genomes)
+        finished = [False] * len(genomes)
+        self.evaluations += len(genomes)
+        pool = self.get_pool()
+        jobs = collections.OrderedDict()
+        for start in range(0, len(genomes), self.chunksize):
+            chunk = genomes[start:start + self.chunksize]
+            task = self.next_task
+            self.next_task += 1
+            jobs[task] = (start, pool.apply_async(run_chunk, (task, chunk, self.scorer, known, instrument.enabled)))
+        running = {}
+        abandoned = False
+        while jobs:
+            # every wait is bounded, so a chunk whose worker died is noticed
+            jobs.values()[0][1].wait(self.Poll)
+            self.read_started(running)
+            now = time.time()
+            for (task, (start, job)) in jobs.items():
+                if job.ready():
+                    del jobs[task]
+                    (results, timings, chunk_keys, stats) = job.get()
+                    scores[start:start + len(results)] = results
+                    keys[start:start + len(results)] = chunk_keys
+                    finished[start:start + len(results)] = [True] * len(results)
+                    self.timings.update(timings)
+                    if stats != None:
+                        instrument.merge(stats)
+                elif task in running:
+                    (pid, began) = running[task]
+                    if self.timeout != None and now - began > self.timeout:
+                        del jobs[task]
+                        abandoned = True
+                    elif not process_alive(pid):
+                        # the pool replaces the worker, but not its chunk
+                        del jobs[task]
+                        abandoned = True
+        if abandoned:
+            # the workers still busy with late chunks are killed, and the
+            # next batch starts on a fresh pool; a pool that lost a chunk
+            # would also never join
+            self.close(wait=False)
+        return (scores, keys, finished)
+
+    def read_started(self, running):
+        # records (pid, start time) by task for the chunks workers started
+        while not self.started.empty():
+            (task, pid, began) = self.started.get()
+            running[task] = (pid, began)
@@ -1,3 +1,5 @@
+import heapq
+import numpy
 import pqdict
 
 class Graph(dict):
@@ -19,11 +21,22 @@ class Graph(dict):
         del self[node_a]
 
     def copy(self):
-        return self.__class__(super(Graph, self)).copy()
+        return self.__class__(dict((node, edges.copy()) for (node, edges) in self.iteritems()))
+
+    def replace_node(self, node_a, node_b):
+        # puts node_b in the place of node_a, with the same edges
+        assert node_a in self and node_b not in self
+        self[node_b] = self.pop(node_a)
+        for edges in self.itervalues():
+            if node_a in edges:
+                edges[node_b] = edges.pop(node_a)
     
     def is_connected(self, node_a, node_b):
         return node_a in self[node_b]
 
+    def freeze(self):
+        return CompactGraph.from_graph(self)
+
     def dijkstra(self, source, target):
         distance = {}
         previous = {}
@@ -86,4 +99,193 @@ class BidirectedGraph(Graph):
         del self[node_a][node_b]
         del self[node_b][node_a]
 
+class DisjointSet(object):
+    # Union-find with union by size and path halving.
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def __contains__(self, item):
+        return item in self.parent
+
+    def add(self, item):
+        assert item not in self.parent
+        self.parent[item] = item
+        self.size[item] = 1
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, item_a, item_b):
+        root_a = self.find(item_a)
+        root_b = self.find(item_b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            (root_a, root_b) = (root_b, root_a)
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size.pop(root_b)
+        return root_a
+
+    def connected(self, item_a, item_b):
+        return self.find(item_a) == self.find(item_b)
+
+    def replace(self, item_a, item_b):
+        # puts item_b in the place of item_a, in the same set
+        parent = self.parent
+        parent[item_b] = parent.pop(item_a)
+        for (item, root) in parent.items():
+            if root is item_a:
+                parent[item] = item_b
+        if item_a in self.size:
+            self.size[item_b] = self.size.pop(item_a)
+
+    def copy(self):
+        other = self.__class__()
+        other.parent = self.parent.copy()
+        other.size = self.size.copy()
+        return other
+
+class CompactGraph(object):
+    # A frozen, array-backed (CSR) copy of a Graph for read-only analysis.
+    # Nodes are numbered in the graph's iteration order, and the neighbors
+    # of node i are neighbors[offsets[i]:offsets[i + 1]], with the matching
+    # edge weights in weights.  Non-numeric weights count as 1, as they do
+    # in Graph.dijkstra.
+    def __init__(self, nodes, offsets, neighbors, weights, directed=False):
+        self.nodes = nodes
+        self.index = dict((node, idx) for (idx, node) in enumerate(nodes))
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.weights = weights
+        self.directed = directed
+
+    @classmethod
+    def from_graph(cls, graph):
+        nodes = list(graph)
+        index = dict((node, idx) for (idx, node) in enumerate(nodes))
+        offsets = numpy.zeros(len(nodes) + 1, dtype=numpy.int64)
+        neighbors = []
+        weights = []
+        for (idx, node) in enumerate(nodes):
+            edges = graph[node]
+            offsets[idx + 1] = offsets[idx] + len(edges)
+            for (neighbor, weight) in edges.iteritems():
+                neighbors.append(index[neighbor])
+                if not isinstance(weight, (int, long, float)):
+                    weight = 1
+                weights.append(weight)
+        neighbors = numpy.array(neighbors, dtype=numpy.int64)
+        weights = numpy.array(weights, dtype=float)
+        directed = isinstance(graph, DirectedGraph)
+        return cls(nodes, offsets, neighbors, weights, directed)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def degree(self):
+        return numpy.diff(self.offsets)
 
+    def sources(self):
+        return numpy.repeat(numpy.arange(len(self.nodes)), self.degree())
+
+    def expand(self, frontier):
+        # the neighbors of every node in frontier, concatenated
+        starts = self.offsets[frontier]
+        counts = self.offsets[frontier + 1] - starts
+        total = counts.sum()
+        if not total:
+            return numpy.zeros(0, dtype=numpy.int64)
+        shifts = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts)
+        return self.neighbors[shifts + numpy.arange(total)]
+
+    def bfs(self, source):
+        # Returns (order, depth): the node ids reachable from source, level
+        # by level, and the hop count to every node (-1 if unreachable).
+        depth = numpy.empty(len(self.nodes), dtype=numpy.int64)
+        depth.fill(-1)
+        depth[source] = 0
+        frontier = numpy.array([source], dtype=numpy.int64)
+        levels = [frontier]
+        level = 0
+        while len(frontier):
+            level += 1
+            candidates = self.expand(frontier)
+            frontier = numpy.unique(candidates[depth[candidates] < 0])
+            depth[frontier] = level
+            levels.append(frontier)
+        return (numpy.concatenate(levels), depth)
+
+    def connected_components(self):
+        # Labels every node with the index of its (weakly) connected
+        # component, by propagating the smallest node id along the edges.
+        labels = numpy.arange(len(self.nodes))
+        sources = self.sources()
+        targets = self.neighbors
+        while True:
+            previous = labels.copy()
+            numpy.minimum.at(labels, sources, labels[targets])
+            numpy.minimum.at(labels, targets, labels[sources])
+            labels = labels[labels]
+            if numpy.array_equal(labels, previous):
+                break
+        return numpy.unique(labels, return_inverse=True)[1]
+
+    def dijkstra(self, source, target=None):
+        # Returns (distance, previous) arrays indexed by node id; previous
+        # is -1 for the source and for unreachable nodes.
+        distance = numpy.empty(len(self.nodes))
+        distance.fill(float("inf"))
+        previous = numpy.empty(len(self.nodes), dtype=numpy.int64)
+        previous.fill(-1)
+        distance[source] = 0
+        done = numpy.zeros(len(self.nodes), dtype=bool)
+        offsets = self.offsets
+        neighbors = self.neighbors
+        weights = self.weights
+        queue = [(0.0, source)]
+        while queue:
+            (node_distance, node) = heapq.heappop(queue)
+            if done[node]:
+                continue
+            done[node] = True
+            if node == target:
+                break
+            start = offsets[node]
+            stop = offsets[node + 1]
+            alt = node_distance + weights[start:stop]
+            nodes = neighbors[start:stop]
+            better = alt < distance[nodes]
+            for (neighbor, neighbor_distance) in zip(nodes[better].tolist(), alt[better].tolist()):
+                distance[neighbor] = neighbor_distance
+                previous[neighbor] = node
+                heapq.heappush(queue, (neighbor_distance, neighbor))
+        return (distance, previous)
+
+    def shortest_path(self, source, target):
+        # Returns (path, total_distance) over node ids, or None.
+        (distance, previous) = self.dijkstra(source, target)
+        if distance[target] == float("inf"):
+            return None
+        node = target
+        path = [node]
+        while node != source:
+            node = previous[node]
+            path.append(node)
+        path.reverse()
+        return (path, distance[target])
+
+    def path(self, source, target):
+        # Graph.path over node objects; like Graph.path, a path from a node
+        # to itself is None
+        if source == target:
+            return None
+        result = self.shortest_path(self.index[source], self.index[target])
+        if result == None:
+            return None
+        (path, total_distance) = result
+        return ([self.nodes[idx] for idx in path], total_distance)
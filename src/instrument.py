@@ -0,0 +1,101 @@
+# Opt-in timers and counters for the pipeline stages.  Instrumentation is off
+# by default; while it is off, timer() hands back a shared no-op context
+# manager and count() returns immediately, and the hottest call sites check
+# `enabled` before doing anything at all.  Stats are per process; capture()
+# collects them for one call in a worker, and merge() folds them back in.
+
+import collections
+import json
+import timeit
+
+enabled = False
+_timers = collections.defaultdict(lambda: [0, 0.0])
+_counters = collections.Counter()
+
+class _Timer(object):
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, timeit.default_timer() - self.started)
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_null_timer = _NullTimer()
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    _timers.clear()
+    _counters.clear()
+
+def timer(name):
+    if not enabled:
+        return _null_timer
+    return _Timer(name)
+
+def timed(name, func):
+    # Wraps func so every call is recorded under name.
+    def wrapper(*args, **kw):
+        started = timeit.default_timer()
+        try:
+            return func(*args, **kw)
+        finally:
+            record(name, timeit.default_timer() - started)
+    return wrapper
+
+def record(name, seconds, calls=1):
+    entry = _timers[name]
+    entry[0] += calls
+    entry[1] += seconds
+
+def count(name, value=1):
+    if enabled:
+        _counters[name] += value
+
+def stats():
+    timers = {}
+    for (name, (calls, seconds)) in _timers.items():
+        timers[name] = {"calls": calls, "seconds": seconds, "mean": seconds / calls}
+    return {"timers": timers, "counters": dict(_counters)}
+
+def merge(other):
+    for (name, entry) in other["timers"].items():
+        record(name, entry["seconds"], entry["calls"])
+    _counters.update(other["counters"])
+
+def capture(func, *args, **kw):
+    # Calls func with instrumentation enabled and returns (result, stats)
+    # for that call alone.  The stats recorded before are kept.
+    global enabled
+    saved = (enabled, stats())
+    reset()
+    enabled = True
+    try:
+        result = func(*args, **kw)
+        captured = stats()
+    finally:
+        reset()
+        enabled = saved[0]
+        merge(saved[1])
+    return (result, captured)
+
+def to_json(**kw):
+    return json.dumps(stats(), sort_keys=True, **kw)
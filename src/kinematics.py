@@ -0,0 +1,164 @@
+import fractions
+import math
+import numpy
+
+def circle_intersect(center_a, radius_a, center_b, radius_b):
+    # Vectorized form of primitives.Circle.intersect.  Centers are (N, 2)
+    # arrays, radii are scalars or (N,) arrays.  Where the circles do not
+    # meet, both intersections are NaN instead of raising ValueError.
+    delta = center_b - center_a
+    distance = numpy.hypot(delta[:, 0], delta[:, 1])
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        alpha = (radius_a ** 2 - radius_b ** 2 + distance ** 2) / (2.0 * distance)
+        beta = numpy.sqrt(radius_a ** 2 - alpha ** 2)
+        unit = delta / distance[:, numpy.newaxis]
+    mid = center_a + alpha[:, numpy.newaxis] * unit
+    offset = beta[:, numpy.newaxis] * numpy.column_stack((unit[:, 1], -unit[:, 0]))
+    return (mid + offset, mid - offset)
+
+class KinematicSolver(object):
+    # Solves the gear/linkage tree built by physics.WorldBuild for a whole
+    # array of motor (crank) angles at once, without pymunk.  The
+    # intersection branch and the order in which linkages are solved follow
+    # Linkage.calculate_position and WorldBuild.embed.  The builder must
+    # already be laid out with WorldBuild.layout.
+    def __init__(self, builder):
+        self.builder = builder
+        self.motor = builder.gears[0]
+        self.gear_ratios = self.solve_gear_ratios()
+
+    def solve_gear_ratios(self):
+        # Every gear meshed to the motor turns at a fixed ratio of the motor
+        # angle; the sign alternates with each mesh, as in GearJoint.
+        ratios = {self.motor: 1.0}
+        queue = [self.motor]
+        while queue:
+            gear = queue.pop()
+            teeth = float(gear._gear.number_of_teeth)
+            for other in gear.linked_gears:
+                if other in ratios:
+                    continue
+                ratios[other] = -ratios[gear] * teeth / other._gear.number_of_teeth
+                queue.append(other)
+        return ratios
+
+    def sweep(self, angles):
+        # Returns a dict mapping each linkage to a pair of (N, 2) arrays,
+        # (position_a, position_b), one row per crank angle.  Rows where the
+        # mechanism cannot be assembled are NaN.  position_b is None for
+        # linkages that are not pinned to another linkage.
+        angles = numpy.asarray(angles, dtype=float)
+        count = len(angles)
+        positions = {}
+        for gear in self.gear_ratios:
+            if not gear.linked_linkage:
+                continue
+            (angle, radius, linkage) = gear.linked_linkage
+            theta = angle + angles * self.gear_ratios[gear]
+            position_a = numpy.empty((count, 2))
+            position_a[:, 0] = radius * numpy.cos(theta) + gear.position[0]
+            position_a[:, 1] = radius * numpy.sin(theta) + gear.position[1]
+            positions[linkage] = [position_a, None]
+        for linkage in self.builder.linkages:
+            if linkage not in positions:
+                continue
+            for other in linkage.linked_linkages:
+                if other not in positions:
+                    continue
+                self.solve_pair(positions, linkage, other)
+        return dict((linkage, tuple(pair)) for (linkage, pair) in positions.items())
+
+    def solve_pair(self, positions, linkage, other):
+        (pivot_a, pivot_b) = linkage.linked_linkages[other]
+        center_a = positions[linkage][0]
+        center_b = positions[other][0]
+        (p1, p2) = circle_intersect(center_a, pivot_a, center_b, pivot_b)
+        intersection = numpy.where((p1[:, 1] > p2[:, 1])[:, numpy.newaxis], p1, p2)
+        positions[linkage][1] = self.solve_position_b(linkage, center_a, intersection)
+        positions[other][1] = self.solve_position_b(other, center_b, intersection)
+
+    def solve_position_b(self, linkage, position_a, point):
+        delta = point - position_a
+        angle = numpy.arctan2(delta[:, 1], delta[:, 0])
+        position_b = numpy.empty_like(position_a)
+        position_b[:, 0] = linkage.length * numpy.cos(angle) + position_a[:, 0]
+        position_b[:, 1] = linkage.length * numpy.sin(angle) + position_a[:, 1]
+        return position_b
+
+    def pen(self, linkage, angles):
+        # The pen traces the far end of its linkage segment.
+        return self.sweep(angles)[linkage][1]
+
+class FeasibilityCheck(object):
+    # Decides, before any pymunk objects exist, whether every pinned pair
+    # of linkages can be assembled over the whole motion.  The base pivots
+    # of a pair ride on two gears, so their distance stays between
+    # D - ra - rb and D + ra + rb (D the distance between the gear centers,
+    # ra and rb the crank radii), and the pivot circles meet only while it
+    # stays between |pivot_a - pivot_b| and pivot_a + pivot_b.  Most pairs
+    # are settled by comparing those ranges; the rest are swept, samples
+    # crank positions per motor turn, over the turns it takes both gears to
+    # return to their starting angles.  The builder must already be laid
+    # out with WorldBuild.layout.
+    def __init__(self, builder, samples=256, max_samples=1 << 16):
+        self.builder = builder
+        self.samples = samples
+        self.max_samples = max_samples
+        self.solver = KinematicSolver(builder)
+        self.drivers = {}
+        for gear in self.solver.gear_ratios:
+            if gear.linked_linkage:
+                self.drivers[gear.linked_linkage[2]] = gear
+
+    def reason(self):
+        # Returns why the mechanism can not be assembled, or None.
+        paired = set()
+        for linkage in self.builder.linkages:
+            for other in linkage.linked_linkages:
+                for item in (linkage, other):
+                    if item not in self.drivers:
+                        return "linkage %s is not driven by the motor" % item.name
+                reason = self.check_pair(linkage, other)
+                if reason != None:
+                    return reason
+                paired.update((linkage, other))
+        for linkage in self.drivers:
+            if linkage not in paired:
+                return "linkage %s is not pinned to another linkage" % linkage.name
+        return None
+
+    def period(self, gear):
+        # motor turns after which gear is back at its starting angle
+        motor_teeth = int(self.solver.motor._gear.number_of_teeth)
+        teeth = int(gear._gear.number_of_teeth)
+        return teeth // fractions.gcd(motor_teeth, teeth)
+
+    def check_pair(self, linkage, other):
+        (pivot_a, pivot_b) = linkage.linked_linkages[other]
+        (low, high) = (abs(pivot_a - pivot_b), pivot_a + pivot_b)
+        (gear_a, gear_b) = (self.drivers[linkage], self.drivers[other])
+        (radius_a, radius_b) = (gear_a.linked_linkage[1], gear_b.linked_linkage[1])
+        distance = math.hypot(gear_b.position[0] - gear_a.position[0], gear_b.position[1] - gear_a.position[1])
+        near = max(0.0, distance - abs(radius_a) - abs(radius_b))
+        far = distance + abs(radius_a) + abs(radius_b)
+        if near > high or far < low:
+            return "linkages %s and %s never meet" % (linkage.name, other.name)
+        if near > low and far < high:
+            return None
+        period_a = self.period(gear_a)
+        period_b = self.period(gear_b)
+        turns = period_a * period_b // fractions.gcd(period_a, period_b)
+        count = min(self.samples * turns, self.max_samples)
+        angles = numpy.linspace(0, 2 * math.pi * turns, count, endpoint=False)
+        center_a = self.crank(gear_a, angles)
+        center_b = self.crank(gear_b, angles)
+        reach = numpy.hypot(*(center_b - center_a).T)
+        if (reach > high).any() or (reach <= low).any():
+            return "linkages %s and %s come apart" % (linkage.name, other.name)
+        return None
+
+    def crank(self, gear, angles):
+        (angle, radius, linkage) = gear.linked_linkage
+        theta = angle + angles * self.solver.gear_ratios[gear]
+        return numpy.column_stack((radius * numpy.cos(theta) + gear.position[0],
+                                   radius * numpy.sin(theta) + gear.position[1]))
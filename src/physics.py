@@ -1,10 +1,12 @@
 import math
-import pyglet
+import numpy
 import pymunk
 import random
 from pymunk.vec2d import Vec2d
-from visualization import draw
+import instrument
+import kinematics
 from scad.gear import *
+from primitives import Circle
 
 GEAR_LAYER = 0
 LINKAGE_LAYER = 1
@@ -110,8 +112,7 @@ class Linkage(object):
         world.add(self.body, self.segment)
 
     def embed_pivot(self, world, linkage):
-        print "linking %s to %s." % (self.name, linkage.name)
-        print self.pivot_points[linkage]
+        instrument.count("embed.pivot_joints")
         joint = pymunk.constraint.PivotJoint(self.body, linkage.body, self.pivot_points[linkage])
         world.add(joint)
 
@@ -144,7 +145,6 @@ class Gear(object):
         self.linked_gears = _linked_gears
 
     def set_position(self, position):
-        print "setting gear position", self.name, self.linked_linkage
         self.position = position
         for gear in self.linked_gears:
             angle = self.linked_gears[gear]
@@ -156,7 +156,6 @@ class Gear(object):
             (angle, radius, linkage) = self.linked_linkage
             x = radius * math.cos(angle) + self.position[0]
             y = radius * math.sin(angle) + self.position[1]
-            print "setting position a", linkage.name
             linkage.position_a = (x, y)
 
     def embed(self, world):
@@ -166,7 +165,6 @@ class Gear(object):
             self.embed_gear_joint(world, gear)
         if self.linked_linkage:
             (angle, radius, linkage) = self.linked_linkage
-            print "embedding linkage", linkage.name
             linkage.embed(world)
             self.embed_link_joint(world, linkage)
 
@@ -182,14 +180,14 @@ class Gear(object):
         world.add(self.body, self.circle, joint)
 
     def embed_gear_joint(self, world, other):
-        print "linking %s to %s." % (self.name, other.name)
+        instrument.count("embed.gear_joints")
         ratio = other._gear.number_of_teeth / float(self._gear.number_of_teeth)
         ratio = -ratio
         joint = pymunk.constraint.GearJoint(self.body, other.body, 0, ratio)
         world.add(joint)
 
     def embed_link_joint(self, world, linkage):
-        print "linking %s to %s." % (self.name, linkage.name)
+        instrument.count("embed.link_joints")
         joint = pymunk.constraint.PivotJoint(self.body, linkage.body, linkage.position_a)
         world.add(joint)
 
@@ -226,16 +224,36 @@ class WorldBuild(object):
         self.gears = []
         self.linkages = []
 
-    def embed(self):
+    def layout(self):
         (width, height) = self.world.size
         center_width = width / 2
         center_height = height / 2
         position = (center_width, center_height)
         self.gears[0].normalize()
         self.gears[0].set_position(position)
-        for link in self.linkages:
-            link.prepare_embed()
-        self.gears[0].embed(self.world)
+
+    def infeasible_reason(self):
+        # Assumes layout has run; see kinematics.FeasibilityCheck.
+        with instrument.timer("embed.feasibility"):
+            return kinematics.FeasibilityCheck(self).reason()
+
+    def is_feasible(self):
+        self.layout()
+        return self.infeasible_reason() == None
+
+    def embed(self):
+        # Raises ValueError, before creating any pymunk objects, when the
+        # mechanism can not be assembled over its whole motion.
+        with instrument.timer("embed.positions"):
+            self.layout()
+            reason = self.infeasible_reason()
+            if reason != None:
+                instrument.count("embed.infeasible")
+                raise ValueError(reason)
+            for link in self.linkages:
+                link.prepare_embed()
+        with instrument.timer("embed.bodies"):
+            self.gears[0].embed(self.world)
 
     def scale(self, script, *args):
         if len(args) == 1:
@@ -357,16 +375,25 @@ class World(object):
         self.world.add(*args, **kw)
 
     def step(self, val):
-        self.world.step(val)
+        if instrument.enabled:
+            with instrument.timer("world.step"):
+                self.world.step(val)
+        else:
+            self.world.step(val)
     
 class RenderSimulation(object):
-    def __init__(self, simulation, pen=None):
+    # pyglet and the renderer are imported here rather than at module level,
+    # so the rest of physics runs without a display.
+    def __init__(self, simulation, pen=None, trail_length=20000):
+        from visualization import PenTrail, Renderer
         self.simulation = simulation
         self.pen = pen
-        self.pen_points = []
         self.init_pyglet()
+        self.renderer = Renderer()
+        self.pen_trail = PenTrail(trail_length)
 
     def init_pyglet(self):
+        import pyglet
         (width, height) = self.simulation.size
         config = pyglet.gl.Config(sample_buffers=1, samples=2, double_buffer=True)
         self.window = pyglet.window.Window(config=config, width=width, height=height, vsync=False)
@@ -381,6 +408,7 @@ class RenderSimulation(object):
             self.simulation.step(1.0 / 30.0 / r)               
 
     def run(self):
+        import pyglet
         pyglet.clock.schedule_interval(self.update, 1 / 30.0)
         pyglet.app.run()
 
@@ -388,22 +416,43 @@ class RenderSimulation(object):
         if not self.pen:
             return
         body = self.pen.body
-        pv1 = body.position + self.pen.a.rotated(body.angle)
         pv2 = body.position + self.pen.b.rotated(body.angle)
-        self.pen_points.extend(pv2)
-        self.pen_points = self.pen_points[-20:]
-        count = len(self.pen_points) / 2
-        if count < 2:
-            return
-        color = (255, 0, 0)
-        pyglet.graphics.draw(count, pyglet.gl.GL_LINE_STRIP, ('v2f', self.pen_points), ('c3B', color * count))
+        self.pen_trail.add(pv2.x, pv2.y)
+        self.pen_trail.draw()
 
     def on_draw(self):
+        import pyglet
         pyglet.gl.glClearColor(240,240,240,255)
         self.window.clear()
-        draw(self.simulation.world)
+        self.renderer.draw(self.simulation.world)
         self.draw_pen()
 
+class HeadlessSimulation(object):
+    def __init__(self, simulation, pen, step_size=1.0 / 300.0):
+        self.simulation = simulation
+        self.pen = pen
+        self.step_size = step_size
+
+    def pen_position(self):
+        body = self.pen.body
+        return body.position + self.pen.b.rotated(body.angle)
+
+    def run(self, steps, sample_interval=10):
+        # Steps the world with a fixed step size, as fast as possible, and
+        # records the pen's endpoint once every sample_interval steps, and
+        # after the last step when steps is not a multiple of it.
+        count = -(-steps // sample_interval)
+        trajectory = numpy.empty((count, 2))
+        step = self.simulation.step
+        step_size = self.step_size
+        for idx in range(count):
+            for x in range(min(sample_interval, steps - idx * sample_interval)):
+                step(step_size)
+            point = self.pen_position()
+            trajectory[idx, 0] = point.x
+            trajectory[idx, 1] = point.y
+        return trajectory
+
 def use_case_one(world):
     builder = WorldBuild(world)
     builder.add_gear(number_of_teeth=20)
@@ -424,8 +473,9 @@ def random_config(world):
     builder.parse(script)
     builder.embed(world)
 
-size = (500, 500)
-world = World(size)
-pen = use_case_one(world)
-render = RenderSimulation(world, pen.segment)
-render.run()
+if __name__ == "__main__":
+    size = (500, 500)
+    world = World(size)
+    pen = use_case_one(world)
+    render = RenderSimulation(world, pen.segment)
+    render.run()
@@ -0,0 +1,97 @@
+import os
+import numpy
+from numpy.lib.format import open_memmap
+
+from . import genome
+
+MetadataType = numpy.dtype([
+    ("length", numpy.uint32),
+    ("generation", numpy.uint32),
+    ("fitness", numpy.float64),
+    ("closure", numpy.float64),
+    ("area", numpy.float64),
+    ("arc_length", numpy.float64),
+    ("xmin", numpy.float64),
+    ("ymin", numpy.float64),
+    ("xmax", numpy.float64),
+    ("ymax", numpy.float64),
+])
+
+class PopulationStore(object):
+    # A generation of genomes stored as a directory of two .npy files: a
+    # (count, width) uint32 genome matrix, padded with zeros past each
+    # genome's length, and a metadata table with one row per genome.  Both
+    # are memory mapped, so opening a store, reading a genome or handing a
+    # slice of the population to another process copies nothing.  Fitness
+    # and trajectory fields are NaN until they are recorded.
+    GenomeFile = "genomes.npy"
+    MetadataFile = "metadata.npy"
+
+    def __init__(self, path, genes, metadata, genome_class=genome.GearPivotGenome):
+        self.path = path
+        self.genes = genes
+        self.metadata = metadata
+        self.genome_class = genome_class
+
+    @classmethod
+    def create(cls, path, count, width, generation=0, genome_class=genome.GearPivotGenome):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        genes = open_memmap(os.path.join(path, cls.GenomeFile), mode="w+", dtype=numpy.uint32, shape=(count, width))
+        metadata = open_memmap(os.path.join(path, cls.MetadataFile), mode="w+", dtype=MetadataType, shape=(count,))
+        for name in MetadataType.names:
+            if MetadataType[name].kind == "f":
+                metadata[name] = numpy.nan
+        metadata["length"] = width
+        metadata["generation"] = generation
+        return cls(path, genes, metadata, genome_class)
+
+    @classmethod
+    def open(cls, path, mode="r", genome_class=genome.GearPivotGenome):
+        genes = numpy.load(os.path.join(path, cls.GenomeFile), mmap_mode=mode)
+        metadata = numpy.load(os.path.join(path, cls.MetadataFile), mmap_mode=mode)
+        return cls(path, genes, metadata, genome_class)
+
+    @classmethod
+    def save(cls, path, genomes, generation=0, fitness=None):
+        width = max(len(item) for item in genomes)
+        store = cls.create(path, len(genomes), width, generation, genomes[0].__class__)
+        for (idx, item) in enumerate(genomes):
+            store.genes[idx, :len(item)] = item.genes
+            store.metadata["length"][idx] = len(item)
+        if fitness is not None:
+            store.record_fitness(fitness)
+        store.flush()
+        return store
+
+    def __len__(self):
+        return len(self.genes)
+
+    def __getitem__(self, idx):
+        length = self.metadata["length"][idx]
+        return self.genome_class(self.genes[idx, :length])
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def record_fitness(self, fitness, start=0):
+        values = [numpy.nan if score == None else score for score in fitness]
+        self.metadata["fitness"][start:start + len(values)] = values
+
+    def record(self, idx, **fields):
+        for (name, value) in fields.items():
+            self.metadata[name][idx] = value
+
+    def flush(self):
+        for array in (self.genes, self.metadata):
+            if isinstance(array, numpy.memmap):
+                array.flush()
+
+def load_genomes(path, start=0, stop=None):
+    # Entry point for worker processes: maps the store read-only and returns
+    # genomes that are views into the shared file.
+    store = PopulationStore.open(path)
+    if stop == None:
+        stop = len(store)
+    return [store[idx] for idx in range(start, stop)]
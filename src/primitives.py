@@ -1,5 +1,5 @@
+import math
 from graph import *
-from visualization import *
 
 class Point(list):
     def __init__(self, *args, **kw):
@@ -0,0 +1,184 @@
+import math
+import numpy
+import struct
+import zlib
+
+def write_png(path, image):
+    # Writes an (height, width, 3) or (height, width) uint8 image.
+    image = numpy.ascontiguousarray(image, dtype=numpy.uint8)
+    (height, width) = image.shape[:2]
+    if image.ndim == 3:
+        color_type = 2
+    else:
+        color_type = 0
+    rows = image.reshape(height, -1)
+    raw = numpy.hstack((numpy.zeros((height, 1), dtype=numpy.uint8), rows)).tostring()
+    def chunk(kind, data):
+        crc = zlib.crc32(kind + data) & 0xffffffff
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    with open(path, "wb") as fh:
+        fh.write("\x89PNG\r\n\x1a\n")
+        fh.write(chunk("IHDR", header))
+        fh.write(chunk("IDAT", zlib.compress(raw, 6)))
+        fh.write(chunk("IEND", ""))
+
+def polyline_segments(polylines, closed=False):
+    # Returns (starts, ends) for the segments of one (N, 2) polyline, a list
+    # of them, or a (B, N, 2) stack.  Segments touching a NaN point (such as
+    # angles where a mechanism could not be assembled) are dropped.
+    if isinstance(polylines, numpy.ndarray) and polylines.ndim == 2:
+        polylines = polylines[numpy.newaxis]
+    if isinstance(polylines, numpy.ndarray):
+        if closed:
+            polylines = numpy.concatenate((polylines, polylines[:, :1]), axis=1)
+        starts = polylines[:, :-1].reshape(-1, 2)
+        ends = polylines[:, 1:].reshape(-1, 2)
+    else:
+        pairs = [polyline_segments(numpy.asarray(polyline, dtype=float), closed) for polyline in polylines]
+        if not pairs:
+            return (numpy.zeros((0, 2)), numpy.zeros((0, 2)))
+        starts = numpy.concatenate([pair[0] for pair in pairs])
+        ends = numpy.concatenate([pair[1] for pair in pairs])
+    valid = numpy.isfinite(starts).all(axis=1) & numpy.isfinite(ends).all(axis=1)
+    return (starts[valid], ends[valid])
+
+class Canvas(object):
+    # An RGB float image in world orientation: x grows to the right and y
+    # grows upward, as in pymunk and pyglet.  Lines are anti-aliased by
+    # sampling them every half pixel and splatting each sample bilinearly
+    # into a coverage buffer, so any number of segments is drawn in a few
+    # vectorized passes.  Lines wider than a pixel are drawn as parallel
+    # lanes of samples, half a pixel apart across the line.
+    SampleSpacing = 0.5
+
+    def __init__(self, width, height, background=(255, 255, 255)):
+        self.width = width
+        self.height = height
+        self.image = numpy.empty((height, width, 3))
+        self.image[:] = background
+
+    def coverage(self, starts, ends, line_width=1.0):
+        delta = ends - starts
+        lengths = numpy.hypot(delta[:, 0], delta[:, 1])
+        counts = numpy.ceil(lengths / self.SampleSpacing).astype(int) + 1
+        segment = numpy.repeat(numpy.arange(len(starts)), counts)
+        first = numpy.cumsum(counts) - counts
+        step = numpy.arange(counts.sum()) - numpy.repeat(first, counts)
+        t = step / numpy.maximum(counts - 1, 1).astype(float)[segment]
+        points = starts[segment] + t[:, numpy.newaxis] * delta[segment]
+        weights = line_width * (lengths / counts)[segment]
+        lanes = max(int(math.ceil((line_width - 1) / self.SampleSpacing)) + 1, 1)
+        if lanes > 1:
+            normals = numpy.column_stack((-delta[:, 1], delta[:, 0])) / numpy.maximum(lengths, 1e-12)[:, numpy.newaxis]
+            offsets = numpy.linspace(-(line_width - 1) / 2.0, (line_width - 1) / 2.0, lanes)
+            points = (points + offsets[:, numpy.newaxis, numpy.newaxis] * normals[segment]).reshape(-1, 2)
+            weights = numpy.tile(weights / lanes, lanes)
+        # pixel centers sit at half-integer coordinates; rows run top down
+        fx = points[:, 0] - 0.5
+        fy = (self.height - points[:, 1]) - 0.5
+        ix = numpy.floor(fx).astype(int)
+        iy = numpy.floor(fy).astype(int)
+        dx = fx - ix
+        dy = fy - iy
+        total = numpy.zeros(self.width * self.height)
+        for (ox, oy, weight) in ((0, 0, (1 - dx) * (1 - dy)), (1, 0, dx * (1 - dy)),
+                                 (0, 1, (1 - dx) * dy), (1, 1, dx * dy)):
+            x = ix + ox
+            y = iy + oy
+            inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+            flat = y[inside] * self.width + x[inside]
+            total += numpy.bincount(flat, weights=(weights * weight)[inside], minlength=len(total))
+        return numpy.minimum(total.reshape(self.height, self.width), 1.0)
+
+    def composite(self, coverage, color):
+        alpha = coverage[:, :, numpy.newaxis]
+        self.image *= 1 - alpha
+        self.image += alpha * numpy.asarray(color, dtype=float)
+
+    def draw_segments(self, starts, ends, color=(0, 0, 0), line_width=1.0):
+        starts = numpy.asarray(starts, dtype=float).reshape(-1, 2)
+        ends = numpy.asarray(ends, dtype=float).reshape(-1, 2)
+        if len(starts):
+            self.composite(self.coverage(starts, ends, line_width), color)
+
+    def draw_lines(self, polylines, color=(255, 0, 0), line_width=1.0, closed=False):
+        (starts, ends) = polyline_segments(polylines, closed)
+        self.draw_segments(starts, ends, color, line_width)
+
+    def draw_circle(self, center, radius, color=(0, 0, 0), line_width=1.0):
+        num_segments = max(int(4 * math.sqrt(radius)), 8)
+        angles = numpy.linspace(0, 2 * math.pi, num_segments + 1)
+        points = numpy.column_stack((radius * numpy.cos(angles), radius * numpy.sin(angles)))
+        self.draw_lines(points + center, color, line_width)
+
+    def draw_space(self, space, constraints=True):
+        # Outlines the shapes of a pymunk space (World.world), colored as
+        # the pyglet renderer colors them.
+        import pymunk
+        for shape in space.shapes:
+            body = shape.body
+            if isinstance(shape, pymunk.Circle):
+                center = body.position + shape.offset.rotated(body.angle)
+                self.draw_circle((center.x, center.y), shape.radius, getattr(shape, "color", (255, 0, 0)))
+            elif isinstance(shape, pymunk.Segment):
+                pv1 = body.position + shape.a.rotated(body.angle)
+                pv2 = body.position + shape.b.rotated(body.angle)
+                self.draw_segments((pv1.x, pv1.y), (pv2.x, pv2.y), getattr(shape, "color", (0, 0, 255)), max(2 * shape.radius, 1.0))
+            elif isinstance(shape, pymunk.Poly):
+                points = [(vertex.x, vertex.y) for vertex in shape.get_vertices()]
+                self.draw_lines(numpy.array(points), getattr(shape, "color", (0, 255, 0)), closed=True)
+        if not constraints:
+            return
+        lines = []
+        for constraint in space.constraints:
+            if hasattr(constraint, "anchr1"):
+                pv1 = constraint.a.position + constraint.anchr1.rotated(constraint.a.angle)
+                pv2 = constraint.b.position + constraint.anchr2.rotated(constraint.b.angle)
+            else:
+                pv1 = constraint.a.position
+                pv2 = constraint.b.position
+            lines.append(((pv1.x, pv1.y), (pv2.x, pv2.y)))
+        if lines:
+            lines = numpy.array(lines)
+            self.draw_segments(lines[:, 0], lines[:, 1], (169, 169, 169))
+
+    def to_array(self):
+        return numpy.clip(numpy.round(self.image), 0, 255).astype(numpy.uint8)
+
+    def save(self, path):
+        write_png(path, self.to_array())
+
+def fit_trajectories(trajectories, cell, margin):
+    # Scales and centers each trajectory of a (B, N, 2) stack into a
+    # cell x cell square, keeping its aspect ratio.
+    low = numpy.nanmin(trajectories, axis=1)
+    high = numpy.nanmax(trajectories, axis=1)
+    extent = numpy.nanmax(high - low, axis=1)
+    extent[~(extent > 0)] = 1.0
+    scale = (cell - 2.0 * margin) / extent
+    middle = (low + high) / 2.0
+    return (trajectories - middle[:, numpy.newaxis]) * scale[:, numpy.newaxis, numpy.newaxis] + cell / 2.0
+
+def contact_sheet(trajectories, columns=None, cell=128, margin=8, color=(255, 0, 0), background=(255, 255, 255)):
+    # Draws a grid of pen curves, one per cell, from a (B, N, 2) stack or a
+    # list of (N, 2) arrays, in a single rasterization pass.  Cells are
+    # filled left to right, top to bottom.  Returns the Canvas.
+    if not isinstance(trajectories, numpy.ndarray):
+        length = max(len(trajectory) for trajectory in trajectories)
+        stack = numpy.empty((len(trajectories), length, 2))
+        stack.fill(numpy.nan)
+        for (idx, trajectory) in enumerate(trajectories):
+            stack[idx, :len(trajectory)] = trajectory
+        trajectories = stack
+    count = len(trajectories)
+    if columns == None:
+        columns = int(math.ceil(math.sqrt(count)))
+    rows = int(math.ceil(count / float(columns)))
+    with numpy.errstate(invalid="ignore"):
+        fitted = fit_trajectories(numpy.asarray(trajectories, dtype=float), cell, margin)
+    idx = numpy.arange(count)
+    origins = numpy.column_stack((idx % columns, rows - 1 - idx // columns)) * cell
+    canvas = Canvas(columns * cell, rows * cell, background)
+    canvas.draw_lines(fitted + origins[:, numpy.newaxis], color)
+    return canvas
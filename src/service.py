@@ -0,0 +1,274 @@
+"""A long running evaluation service.
+
+Keeps a warm process pool and scores genomes sent over a socket, so other
+tools can query fitness without importing the package or starting a pool
+per call.  Every frame is a little endian header (kind, request id, payload
+bytes) followed by the payload:
+
+    EVALUATE  uint32 [count, length * count, genes...]
+    CANCEL    empty
+    RESULT    uint32 index, float64 score (NaN when the genome scored None)
+    DONE      uint32 number of results sent
+    ERROR     message text
+
+Results stream back as their chunks finish, in completion order, followed
+by DONE.  After CANCEL, chunks not yet started are dropped and DONE follows
+the ones already running.  Backpressure: at most max_pending chunks are
+queued on the pool across all connections and at most max_requests are
+open per connection.  After each EVALUATE the connection waits for an open
+request and for a pool slot for the first chunk before reading the next
+frame, so past either limit the server stops reading and TCP holds the
+client back.
+"""
+
+import Queue
+import SocketServer
+import socket
+import struct
+import threading
+
+import numpy
+from concurrent import futures
+
+from . import genome
+from . import instrument
+
+Header = struct.Struct("<BII")
+Result = struct.Struct("<Id")
+Count = struct.Struct("<I")
+
+EVALUATE = 1
+CANCEL = 2
+RESULT = 3
+DONE = 4
+ERROR = 5
+
+def encode_genomes(genomes):
+    lengths = [len(item) for item in genomes]
+    words = [numpy.array([len(genomes)] + lengths, dtype="<u4")]
+    words.extend(numpy.asarray(item.genes, dtype="<u4") for item in genomes)
+    return numpy.concatenate(words).tostring()
+
+def decode_genomes(payload, genome_class=genome.GearPivotGenome):
+    words = numpy.fromstring(payload, dtype="<u4").astype(numpy.uint32)
+    if not len(words):
+        raise ValueError("empty payload")
+    count = int(words[0])
+    offsets = numpy.cumsum(numpy.concatenate(([1 + count], words[1:1 + count])))
+    if offsets[-1] != len(words):
+        raise ValueError("genome lengths do not match the payload")
+    return [genome_class(words[start:stop]) for (start, stop) in zip(offsets[:-1], offsets[1:])]
+
+def pack_frame(kind, request_id, payload=""):
+    return Header.pack(kind, request_id, len(payload)) + payload
+
+def read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError("connection closed")
+    return data
+
+def read_frame(stream):
+    (kind, request_id, size) = Header.unpack(read_exactly(stream, Header.size))
+    return (kind, request_id, read_exactly(stream, size))
+
+class Request(object):
+    # The chunks of one EVALUATE frame and the results sent for it so far.
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.jobs = []
+        self.submitted = False
+        self.cancelled = False
+        self.finished = 0
+        self.sent = 0
+
+class ServiceHandler(SocketServer.StreamRequestHandler):
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.open_requests = threading.BoundedSemaphore(self.server.max_requests)
+        # frames are sent from one writer thread, so pool callbacks never
+        # block on a slow client
+        self.outgoing = Queue.Queue()
+        self.writer = threading.Thread(target=self.write_frames)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def write_frames(self):
+        while True:
+            frame = self.outgoing.get()
+            if frame == None:
+                break
+            try:
+                self.wfile.write(frame)
+                self.wfile.flush()
+            except socket.error:
+                break
+
+    def send(self, kind, request_id, payload=""):
+        self.outgoing.put(pack_frame(kind, request_id, payload))
+
+    def handle(self):
+        try:
+            while True:
+                (kind, request_id, payload) = read_frame(self.rfile)
+                if kind == EVALUATE:
+                    self.evaluate(request_id, payload)
+                elif kind == CANCEL:
+                    self.cancel(request_id)
+                else:
+                    self.send(ERROR, request_id, "unknown frame kind %d" % kind)
+        except (EOFError, socket.error):
+            pass
+        finally:
+            for request_id in list(self.requests):
+                self.cancel(request_id)
+
+    def finish(self):
+        self.outgoing.put(None)
+        self.writer.join()
+        SocketServer.StreamRequestHandler.finish(self)
+
+    def evaluate(self, request_id, payload):
+        try:
+            genomes = decode_genomes(payload, self.server.genome_class)
+        except ValueError as err:
+            self.send(ERROR, request_id, str(err))
+            return
+        with self.lock:
+            if request_id in self.requests:
+                self.send(ERROR, request_id, "request id already in use")
+                return
+            request = self.requests[request_id] = Request(request_id)
+        self.open_requests.acquire()
+        if genomes:
+            # the first chunk's slot is taken here, so a full pool stops
+            # this connection reading
+            self.server.pending.acquire()
+        thread = threading.Thread(target=self.submit, args=(request, genomes))
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, request, genomes):
+        chunksize = self.server.chunksize
+        for start in range(0, len(genomes), chunksize):
+            if start:
+                self.server.pending.acquire()
+            with self.lock:
+                if request.cancelled:
+                    self.server.pending.release()
+                    break
+                chunk = genomes[start:start + chunksize]
+                job = self.server.pool.submit(genome.evaluate_chunk, chunk, self.server.scorer, None, instrument.enabled)
+                request.jobs.append(job)
+            job.add_done_callback(lambda job, start=start: self.chunk_done(request, start, job))
+        with self.lock:
+            request.submitted = True
+            self.check_done(request)
+
+    def chunk_done(self, request, start, job):
+        self.server.pending.release()
+        with self.lock:
+            request.finished += 1
+            if not (job.cancelled() or request.cancelled):
+                try:
+                    (scores, timings, keys, stats) = job.result()
+                except Exception as err:
+                    self.send(ERROR, request.request_id, repr(err))
+                else:
+                    if stats != None:
+                        instrument.merge(stats)
+                    for (idx, score) in enumerate(scores):
+                        value = numpy.nan if score == None else float(score)
+                        self.send(RESULT, request.request_id, Result.pack(start + idx, value))
+                        request.sent += 1
+            self.check_done(request)
+
+    def check_done(self, request):
+        if request.submitted and request.finished == len(request.jobs):
+            del self.requests[request.request_id]
+            self.open_requests.release()
+            self.send(DONE, request.request_id, Count.pack(request.sent))
+
+    def cancel(self, request_id):
+        with self.lock:
+            request = self.requests.get(request_id)
+            if request == None:
+                return
+            request.cancelled = True
+            jobs = list(request.jobs)
+        for job in jobs:
+            job.cancel()
+
+class EvaluationServer(SocketServer.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, scorer=None, workers=None, chunksize=8, max_pending=64, max_requests=4,
+                 genome_class=genome.GearPivotGenome):
+        SocketServer.ThreadingTCPServer.__init__(self, address, ServiceHandler)
+        if scorer == None:
+            scorer = genome.Scorer()
+        self.scorer = scorer
+        self.chunksize = chunksize
+        self.max_requests = max_requests
+        self.genome_class = genome_class
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.pool = futures.ProcessPoolExecutor(max_workers=workers)
+        self.warm()
+
+    def warm(self):
+        # starts the worker processes now rather than on the first request
+        jobs = [self.pool.submit(genome.evaluate_chunk, [], self.scorer) for x in range(self.pool._max_workers)]
+        futures.wait(jobs)
+
+    def server_close(self):
+        SocketServer.ThreadingTCPServer.server_close(self)
+        self.pool.shutdown(wait=False)
+
+class ServiceClient(object):
+    # A blocking client: send requests with evaluate_async and cancel, read
+    # replies with read; or use evaluate for one request at a time.
+    def __init__(self, address):
+        self.socket = socket.create_connection(address)
+        self.stream = self.socket.makefile("rb")
+        self.next_id = 0
+
+    def evaluate_async(self, genomes):
+        request_id = self.next_id
+        self.next_id += 1
+        self.socket.sendall(pack_frame(EVALUATE, request_id, encode_genomes(genomes)))
+        return request_id
+
+    def cancel(self, request_id):
+        self.socket.sendall(pack_frame(CANCEL, request_id))
+
+    def read(self):
+        # Returns (kind, request_id, value): (index, score) for RESULT, the
+        # result count for DONE, the message for ERROR.
+        (kind, request_id, payload) = read_frame(self.stream)
+        if kind == RESULT:
+            (index, score) = Result.unpack(payload)
+            return (kind, request_id, (index, None if numpy.isnan(score) else score))
+        if kind == DONE:
+            return (kind, request_id, Count.unpack(payload)[0])
+        return (kind, request_id, payload)
+
+    def evaluate(self, genomes):
+        # yields (index, score) as results arrive
+        request_id = self.evaluate_async(genomes)
+        while True:
+            (kind, reply_id, value) = self.read()
+            if reply_id != request_id:
+                continue
+            if kind == RESULT:
+                yield value
+            elif kind == DONE:
+                return
+            elif kind == ERROR:
+                raise ValueError(value)
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
@@ -0,0 +1,178 @@
+import numpy
+
+# Metrics over pen trajectories.  Every function takes one (N, 2) array or a
+# (B, N, 2) stack and returns a scalar (or row) per trajectory: a float for
+# a single trajectory, a (B,) array for a stack.  Trajectories are treated
+# as closed curves, since a crank driven pen retraces its path every turn.
+
+def as_stack(trajectories):
+    trajectories = numpy.asarray(trajectories, dtype=float)
+    if trajectories.ndim == 2:
+        return (trajectories[numpy.newaxis], True)
+    return (trajectories, False)
+
+def unstack(values, single):
+    if single:
+        return values[0]
+    return values
+
+def segments(stack, closed=True):
+    # (B, N, 2) segment vectors, including the closing segment
+    if closed:
+        return numpy.roll(stack, -1, axis=1) - stack
+    return numpy.diff(stack, axis=1)
+
+def closure_error(trajectories):
+    # distance between the first and last point
+    (stack, single) = as_stack(trajectories)
+    delta = stack[:, -1] - stack[:, 0]
+    return unstack(numpy.hypot(delta[:, 0], delta[:, 1]), single)
+
+def signed_area(trajectories):
+    # shoelace formula; positive for counter clockwise curves
+    (stack, single) = as_stack(trajectories)
+    x = stack[:, :, 0]
+    y = stack[:, :, 1]
+    cross = x * numpy.roll(y, -1, axis=1) - numpy.roll(x, -1, axis=1) * y
+    return unstack(cross.sum(axis=1) / 2.0, single)
+
+def area(trajectories):
+    return numpy.abs(signed_area(trajectories))
+
+def bounding_box(trajectories):
+    # (xmin, ymin, xmax, ymax), ignoring NaN points
+    (stack, single) = as_stack(trajectories)
+    with numpy.errstate(invalid="ignore"):
+        low = numpy.nanmin(stack, axis=1)
+        high = numpy.nanmax(stack, axis=1)
+    return unstack(numpy.hstack((low, high)), single)
+
+def arc_length(trajectories, closed=False):
+    (stack, single) = as_stack(trajectories)
+    delta = segments(stack, closed)
+    return unstack(numpy.hypot(delta[:, :, 0], delta[:, :, 1]).sum(axis=1), single)
+
+def turning(stack):
+    # (B, N) turning angles between the segments meeting at each point of a
+    # closed curve, and the mean length of those segments
+    outgoing = segments(stack)
+    incoming = numpy.roll(outgoing, 1, axis=1)
+    cross = incoming[:, :, 0] * outgoing[:, :, 1] - incoming[:, :, 1] * outgoing[:, :, 0]
+    angles = numpy.arctan2(cross, (incoming * outgoing).sum(axis=2))
+    lengths = (numpy.hypot(incoming[:, :, 0], incoming[:, :, 1]) + numpy.hypot(outgoing[:, :, 0], outgoing[:, :, 1])) / 2.0
+    return (angles, lengths)
+
+def curvature(trajectories):
+    # Discrete curvature at each point: the turning angle over the mean
+    # length of the neighbouring segments.  Returns a (N,) or (B, N) array;
+    # points between zero length segments are NaN.
+    (stack, single) = as_stack(trajectories)
+    (angles, lengths) = turning(stack)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        values = angles / lengths
+    values[lengths == 0] = numpy.nan
+    return unstack(values, single)
+
+def curvature_stats(trajectories):
+    # Returns a dict of mean absolute and maximum absolute curvature, the
+    # signed curvature integrated over arc length (the total turning angle,
+    # in radians), and the total turning in full revolutions.
+    (stack, single) = as_stack(trajectories)
+    (angles, lengths) = turning(stack)
+    values = curvature(stack)
+    with numpy.errstate(invalid="ignore"):
+        stats = {
+            "mean": numpy.nanmean(numpy.abs(values), axis=1),
+            "max": numpy.nanmax(numpy.abs(values), axis=1),
+            "total": numpy.nansum(values * lengths, axis=1),
+            "turns": angles.sum(axis=1) / (2 * numpy.pi),
+        }
+    return dict((key, unstack(value, single)) for (key, value) in stats.items())
+
+def count_intersections(points, chunk=256):
+    # Counts crossings between non adjacent segments of one closed
+    # (N, 2) curve.  All pairs are tested, chunk rows at a time, so memory
+    # stays at chunk * N.
+    starts = points
+    delta = numpy.roll(points, -1, axis=0) - points
+    count = len(points)
+    total = 0
+    for first in range(0, count, chunk):
+        rows = numpy.arange(first, min(first + chunk, count))
+        p = starts[rows][:, numpy.newaxis]
+        r = delta[rows][:, numpy.newaxis]
+        q = starts[numpy.newaxis]
+        s = delta[numpy.newaxis]
+        denominator = r[:, :, 0] * s[:, :, 1] - r[:, :, 1] * s[:, :, 0]
+        qp = q - p
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            t = (qp[:, :, 0] * s[:, :, 1] - qp[:, :, 1] * s[:, :, 0]) / denominator
+            u = (qp[:, :, 0] * r[:, :, 1] - qp[:, :, 1] * r[:, :, 0]) / denominator
+            # half open, so a crossing on a sample point counts once
+            crossing = (t >= 0) & (t < 1) & (u >= 0) & (u < 1)
+        # count each pair once, and never a segment against its neighbours
+        columns = numpy.arange(count)
+        later = columns[numpy.newaxis] > rows[:, numpy.newaxis] + 1
+        wraps = (rows[:, numpy.newaxis] == 0) & (columns[numpy.newaxis] == count - 1)
+        total += int((crossing & later & ~wraps).sum())
+    return total
+
+def self_intersections(trajectories, chunk=256):
+    (stack, single) = as_stack(trajectories)
+    counts = numpy.array([count_intersections(points, chunk) for points in stack])
+    return unstack(counts, single)
+
+def resample(trajectories, count=128):
+    # Resamples each closed curve to count points evenly spaced by arc length.
+    (stack, single) = as_stack(trajectories)
+    result = numpy.empty((len(stack), count, 2))
+    for (idx, points) in enumerate(stack):
+        closed = numpy.vstack((points, points[:1]))
+        delta = numpy.diff(closed, axis=0)
+        distance = numpy.concatenate(([0], numpy.cumsum(numpy.hypot(delta[:, 0], delta[:, 1]))))
+        samples = numpy.linspace(0, distance[-1], count, endpoint=False)
+        result[idx, :, 0] = numpy.interp(samples, distance, closed[:, 0])
+        result[idx, :, 1] = numpy.interp(samples, distance, closed[:, 1])
+    return unstack(result, single)
+
+def target_distance(trajectories, target, count=128, scale=False):
+    # RMS distance from each trajectory to a target curve after resampling
+    # both by arc length and centering them, minimized over every starting
+    # point and both directions of travel.  With scale, curves are also
+    # normalized to unit RMS radius, so only the shape is compared.  The
+    # cyclic shifts are scored together as a circular cross correlation.
+    (stack, single) = as_stack(trajectories)
+    curves = resample(stack, count)
+    reference = resample(target, count)
+    curves = curves - curves.mean(axis=1)[:, numpy.newaxis]
+    reference = reference - reference.mean(axis=0)
+    if scale:
+        curves = curves / numpy.sqrt((curves ** 2).sum(axis=2).mean(axis=1))[:, numpy.newaxis, numpy.newaxis]
+        reference = reference / numpy.sqrt((reference ** 2).sum(axis=1).mean())
+    energy = (curves ** 2).sum(axis=(1, 2)) + (reference ** 2).sum()
+    best = numpy.inf
+    for candidate in (reference, reference[::-1]):
+        spectrum = numpy.fft.rfft(curves, axis=1) * numpy.conj(numpy.fft.rfft(candidate, axis=0))
+        correlation = numpy.fft.irfft(spectrum, count, axis=1).sum(axis=2)
+        best = numpy.minimum(best, energy - 2 * correlation.max(axis=1))
+    return unstack(numpy.sqrt(numpy.maximum(best, 0) / count), single)
+
+def similarity(trajectories, target, count=128, scale=False):
+    # 1 for an exact match, falling towards 0 with target_distance
+    return 1.0 / (1.0 + target_distance(trajectories, target, count, scale))
+
+def summarize(trajectories):
+    # The trajectory fields of population.MetadataType, as a dict that can be
+    # passed to PopulationStore.record.
+    (stack, single) = as_stack(trajectories)
+    box = bounding_box(stack)
+    fields = {
+        "closure": closure_error(stack),
+        "area": area(stack),
+        "arc_length": arc_length(stack),
+        "xmin": box[:, 0],
+        "ymin": box[:, 1],
+        "xmax": box[:, 2],
+        "ymax": box[:, 3],
+    }
+    return dict((key, unstack(value, single)) for (key, value) in fields.items())
@@ -1,11 +1,11 @@
-__all__ = ["draw", "GraphViz"]
+__all__ = ["draw", "Renderer", "PenTrail", "GraphViz"]
 
 import math
+import numpy
 import pyglet
 import pymunk
 from pymunk.vec2d import Vec2d
-import graphviz
-from graph import *
+from dotgraph import GraphViz
 
 def draw(*objs, **kwargs):
     new_batch = False
@@ -49,53 +49,23 @@ def _draw_shape(shape, batch = None):
 def _draw_circle(circle, batch = None):
     circle_center = circle.body.position + circle.offset.rotated(circle.body.angle)
     
-    r = 0
     if hasattr(circle, "color"):
         color = circle.color  
     elif circle.body.is_static:
         color = (200, 200, 200)
-        r = 1
     else:
         color = (255, 0, 0)
         
-    #http://slabode.exofire.net/circle_draw.shtml
-    num_segments = int(4 * math.sqrt(circle.radius))
-    theta = 2 * math.pi / num_segments
-    c = math.cos(theta)
-    s = math.sin(theta)
-    
-    x = circle.radius # we start at angle 0
-    y = 0
-    
-    ps = []
-    
-    for i in range(num_segments):
-        ps += [Vec2d(circle_center.x + x, circle_center.y + y)]
-        t = x
-        x = c * x - s * y
-        y = s * t + c * y
-               
-    
     if circle.body.is_static:
         mode = pyglet.gl.GL_LINES
-        ps = [p for p in ps+ps[:1] for _ in (0, 1)]
     else:
         mode = pyglet.gl.GL_TRIANGLE_STRIP
-        ps2 = [ps[0]]
-        for i in range(1, int(len(ps)+1/2)):
-            ps2.append(ps[i])
-            ps2.append(ps[-i])
-        ps = ps2
-    vs = []
-    for p in [ps[0]] + ps + [ps[-1]]:
-            vs += [p.x, p.y]
+    template = _circle_template(circle.radius, circle.body.is_static)
+    vs = (template + (circle_center.x, circle_center.y)).ravel().tolist()
         
     c = circle_center + Vec2d(circle.radius, 0).rotated(circle.body.angle)
     cvs = [circle_center.x, circle_center.y, c.x, c.y]
         
-    bg = pyglet.graphics.OrderedGroup(0)
-    fg = pyglet.graphics.OrderedGroup(1)
-        
     l = len(vs)//2
     if batch == None:
         pyglet.graphics.draw(l, mode,
@@ -105,10 +75,10 @@ def _draw_circle(circle, batch = None):
                             ('v2f', cvs),
                             ('c3B', (0,0,255)*2))
     else:
-        batch.add(len(vs)//2, mode, bg,
+        batch.add(len(vs)//2, mode, _ordered_group(0),
                  ('v2f', vs),
                  ('c3B', color*l))
-        batch.add(2, pyglet.gl.GL_LINES, fg,
+        batch.add(2, pyglet.gl.GL_LINES, _ordered_group(1),
                  ('v2f', cvs),
                  ('c3B', (0,0,255)*2))
     return
@@ -209,16 +179,227 @@ def _draw_line(pv1, pv2, color, batch):
                   ('v2i', line),
                   ('c3B', color * 2))
 
-class GraphViz(object):
-    def render(self, graph, filename="graph_dot"):
-        directed = isinstance(graph, DirectedGraph)
-        dot = graphviz.Graph(format="png")
-        visited = set()
-        for node in graph:
-            dot.node(str(id(node)), label=node.name)
-        for node in graph:
-            for n_node in graph[node]:
-                if directed or (n_node, node) not in visited:
-                    dot.edge(str(id(node)), str(id(n_node)), label=str(graph[node][n_node]))
-                    visited.add((node, n_node))
-        dot.render(filename)
+def _shape_color(shape, color):
+    if hasattr(shape, "color"):
+        return shape.color
+    if shape.body.is_static:
+        return (200, 200, 200)
+    return color
+
+_groups = {}
+_circle_templates = {}
+
+def _ordered_group(order):
+    # Groups are shared between calls, but created on first use, since
+    # touching pyglet.graphics at import time needs a display.
+    if order not in _groups:
+        _groups[order] = pyglet.graphics.OrderedGroup(order)
+    return _groups[order]
+
+def _circle_template(radius, static):
+    # Circle tessellations are cached by radius and mode, since a mechanism
+    # draws the same few gears every frame.
+    key = (radius, static)
+    if key not in _circle_templates:
+        template = _circle_vertices(radius, static)
+        template.flags.writeable = False
+        _circle_templates[key] = template
+    return _circle_templates[key]
+
+def _circle_vertices(radius, static):
+    # The tessellation of a circle (as slabode.exofire.net/circle_draw.shtml)
+    # relative to its center, as an (n, 2) array in drawing order.  Static
+    # circles are outlined with GL_LINES; dynamic ones are filled with a
+    # GL_TRIANGLE_STRIP, with the end vertices doubled so strips can share
+    # a batch.
+    num_segments = int(4 * math.sqrt(radius))
+    angles = numpy.arange(num_segments) * (2 * math.pi / num_segments)
+    ps = numpy.column_stack((radius * numpy.cos(angles), radius * numpy.sin(angles)))
+    if static:
+        order = [idx % num_segments for idx in range(num_segments + 1) for _ in (0, 1)]
+    else:
+        order = [0]
+        for idx in range(1, num_segments):
+            order.append(idx)
+            order.append(-idx % num_segments)
+    order = [order[0]] + order + [order[-1]]
+    return ps[order]
+
+def _vertex_array(vertex_list):
+    # a writable NumPy view of a vertex list's (v2f) vertex data
+    return numpy.ctypeslib.as_array(vertex_list.vertices)
+
+class _BodyItem(object):
+    # Vertex lists that follow one body, with their local-space templates.
+    def __init__(self, body, parts):
+        self.body = body
+        self.parts = parts
+
+    def update(self):
+        body = self.body
+        c = math.cos(body.angle)
+        s = math.sin(body.angle)
+        rotation = numpy.array(((c, s), (-s, c)))
+        position = (body.position.x, body.position.y)
+        for (vertex_list, template) in self.parts:
+            _vertex_array(vertex_list)[:] = (template.dot(rotation) + position).ravel()
+
+    def delete(self):
+        for (vertex_list, template) in self.parts:
+            vertex_list.delete()
+
+class _ConstraintItem(object):
+    # A line between two anchors, each fixed in its body's local space.
+    def __init__(self, vertex_list, body_a, anchor_a, body_b, anchor_b):
+        self.vertex_list = vertex_list
+        self.anchors = ((body_a, anchor_a), (body_b, anchor_b))
+
+    def update(self):
+        vertices = []
+        for (body, anchor) in self.anchors:
+            point = body.position + anchor.rotated(body.angle)
+            vertices.extend((point.x, point.y))
+        _vertex_array(self.vertex_list)[:] = vertices
+
+    def delete(self):
+        self.vertex_list.delete()
+
+class Renderer(object):
+    # Draws a pymunk space from persistent vertex lists.  The first time a
+    # shape or constraint is seen its geometry is built once in body-local
+    # coordinates; after that each frame only transforms those templates by
+    # the bodies' current position and angle and writes them into the
+    # existing vertex lists.  Objects removed from the space are dropped.
+    def __init__(self, batch=None):
+        if batch == None:
+            batch = pyglet.graphics.Batch()
+        self.batch = batch
+        self.items = {}
+
+    def draw(self, space):
+        items = self.items
+        stale = set(items)
+        for objs in (space.shapes, space.constraints):
+            for obj in objs:
+                if hasattr(obj, "ignore_draw") and obj.ignore_draw:
+                    continue
+                if obj not in items:
+                    item = self.add(obj)
+                    if item == None:
+                        continue
+                    items[obj] = item
+                stale.discard(obj)
+                items[obj].update()
+        for obj in stale:
+            items.pop(obj).delete()
+        self.batch.draw()
+
+    def add(self, obj):
+        if isinstance(obj, pymunk.Circle):
+            return self.add_circle(obj)
+        elif isinstance(obj, pymunk.Segment):
+            return self.add_segment(obj)
+        elif isinstance(obj, pymunk.Poly):
+            return self.add_poly(obj)
+        elif isinstance(obj, pymunk.Constraint):
+            return self.add_constraint(obj)
+
+    def add_vertex_list(self, mode, group, template, color):
+        count = len(template)
+        return self.batch.add(count, mode, group, ('v2f', [0] * (count * 2)), ('c3B', color * count))
+
+    def add_circle(self, circle):
+        static = circle.body.is_static
+        color = _shape_color(circle, (255, 0, 0))
+        if static:
+            mode = pyglet.gl.GL_LINES
+        else:
+            mode = pyglet.gl.GL_TRIANGLE_STRIP
+        offset = numpy.array(circle.offset)
+        fill = _circle_template(circle.radius, static) + offset
+        spoke = numpy.array((offset, offset + (circle.radius, 0)))
+        parts = [
+            (self.add_vertex_list(mode, _ordered_group(0), fill, color), fill),
+            (self.add_vertex_list(pyglet.gl.GL_LINES, _ordered_group(1), spoke, (0, 0, 255)), spoke),
+        ]
+        return _BodyItem(circle.body, parts)
+
+    def add_segment(self, segment):
+        a = numpy.array(segment.a)
+        b = numpy.array(segment.b)
+        d = b - a
+        angle = -math.atan2(d[0], d[1])
+        offset = segment.radius * numpy.array((math.cos(angle), math.sin(angle)))
+        (p1, p2, p3, p4) = (a + offset, a - offset, b + offset, b - offset)
+        template = numpy.array((p1, p2, p3, p2, p3, p4))
+        color = _shape_color(segment, (0, 0, 255))
+        vertex_list = self.add_vertex_list(pyglet.gl.GL_TRIANGLES, None, template, color)
+        return _BodyItem(segment.body, [(vertex_list, template)])
+
+    def add_poly(self, poly):
+        ps = [numpy.array(vertex + poly.offset) for vertex in poly.verts]
+        if poly.body.is_static:
+            mode = pyglet.gl.GL_LINES
+            ps = [p for p in ps + ps[:1] for _ in (0, 1)]
+        else:
+            mode = pyglet.gl.GL_TRIANGLE_STRIP
+            ps = [ps[1], ps[2], ps[0]] + ps[3:]
+        template = numpy.array([ps[0]] + ps + [ps[-1]])
+        color = _shape_color(poly, (0, 255, 0))
+        vertex_list = self.add_vertex_list(mode, None, template, color)
+        return _BodyItem(poly.body, [(vertex_list, template)])
+
+    def add_constraint(self, constraint):
+        darkgrey = (169, 169, 169)
+        zero = Vec2d(0, 0)
+        if isinstance(constraint, pymunk.GrooveJoint) and hasattr(constraint, "groove_a"):
+            anchors = (constraint.a, constraint.groove_a, constraint.a, constraint.groove_b)
+        elif hasattr(constraint, "anchr1"):
+            anchors = (constraint.a, constraint.anchr1, constraint.b, constraint.anchr2)
+        else:
+            anchors = (constraint.a, zero, constraint.b, zero)
+        vertex_list = self.batch.add(2, pyglet.gl.GL_LINES, None, ('v2f', [0] * 4), ('c3B', darkgrey * 2))
+        return _ConstraintItem(vertex_list, *anchors)
+
+class PenTrail(object):
+    # The last capacity pen positions, drawn from a single GL_LINES vertex
+    # list used as a ring buffer.  Each new point overwrites the oldest slot
+    # with a segment from the previous point, and only that slot is marked
+    # for upload, so a frame costs the same however long the trail is.
+    # Slots not written yet are zero-length segments, which draw nothing.
+    def __init__(self, capacity=20000, color=(255, 0, 0), batch=None):
+        if batch == None:
+            batch = pyglet.graphics.Batch()
+        self.capacity = capacity
+        self.color = color
+        self.batch = batch
+        self.vertex_list = None
+        self.head = 0
+        self.last = None
+
+    def add(self, x, y):
+        if self.vertex_list == None:
+            count = self.capacity * 2
+            self.vertex_list = self.batch.add(count, pyglet.gl.GL_LINES, None,
+                                              ('v2f', (x, y) * count),
+                                              ('c3B', self.color * count))
+            self.last = (x, y)
+            return
+        vertex_list = self.vertex_list
+        attribute = vertex_list.domain.attribute_names['vertices']
+        start = vertex_list.start + self.head * 2
+        region = attribute.get_region(attribute.buffer, start, 2)
+        region.array[:] = self.last + (x, y)
+        region.invalidate()
+        self.head = (self.head + 1) % self.capacity
+        self.last = (x, y)
+
+    def clear(self):
+        if self.vertex_list != None:
+            self.vertex_list.delete()
+        self.vertex_list = None
+        self.head = 0
+        self.last = None
+
+    def draw(self):
+        self.batch.draw()
@@ -0,0 +1,101 @@
+import collections
+import unittest
+
+from linkage import cache
+from linkage import genome
+
+def mechanism_hash(specie):
+    specie.normalize_graph()
+    return cache.canonical_hash(specie)
+
+def parse_hash(genes):
+    specie = genome.GearPivotSpecie()
+    specie.parse(genes)
+    return mechanism_hash(specie)
+
+def walk(graph, node, kind=object):
+    # the nodes reached from node through nodes of kind
+    visited = set([node])
+    queue = collections.deque([node])
+    while queue:
+        for neighbor in graph[queue.popleft()]:
+            if isinstance(neighbor, kind) and neighbor not in visited:
+                visited.add(neighbor)
+                queue.append(neighbor)
+    return visited
+
+def reference_normalize(specie):
+    # normalize_graph by walks: the motor's gear train, then whatever the
+    # motor still reaches once the other gears are gone
+    graph = specie.graph.copy()
+    motor = specie.gears[0]
+    train = walk(graph, motor, genome.GearGene)
+    for gear in specie.gears:
+        if gear not in train:
+            graph.remove_node(gear)
+    kept = walk(graph, motor)
+    return dict((node, set(graph[node])) for node in kept)
+
+def mutate(genes, offset, delta):
+    genes = genes.copy()
+    genes.genes[offset] = (int(genes.genes[offset]) + delta) % (1 << 32)
+    return genes
+
+class UpdateParametersTest(unittest.TestCase):
+    Seeds = range(50)
+    Length = 300
+
+    def parsed(self, seed):
+        genes = genome.GearPivotGenome.random_genome(self.Length, seed)
+        specie = genome.GearPivotSpecie()
+        specie.parse(genes, checkpoint_interval=20, track_parameters=True)
+        offsets = sorted(offset for (offset, entry) in specie.parameters.items() if entry[0] != None)
+        return (genes, specie, offsets)
+
+    def test_update_then_resume(self):
+        for seed in self.Seeds:
+            (genes, specie, offsets) = self.parsed(seed)
+            if not offsets:
+                continue
+            updated = mutate(genes, offsets[len(offsets) // 2], 12345)
+            self.assertTrue(specie.update_parameters(updated, [offsets[len(offsets) // 2]]))
+            self.assertEqual(mechanism_hash(specie), parse_hash(updated))
+            last = self.Length - 1
+            for base in (genes, updated):
+                other = mutate(base, last, 7)
+                resumed = specie.resume(other, last)
+                self.assertEqual(mechanism_hash(resumed), parse_hash(other))
+
+    def test_update_leaves_parent_unchanged(self):
+        for seed in self.Seeds:
+            (genes, specie, offsets) = self.parsed(seed)
+            if not offsets:
+                continue
+            child = specie.resume(genes, self.Length - 1)
+            self.assertTrue(child.update_parameters(mutate(genes, offsets[0], 12345), [offsets[0]]))
+            self.assertEqual(mechanism_hash(specie), parse_hash(genes))
+
+class NormalizeGraphTest(unittest.TestCase):
+    def test_matches_walks(self):
+        for seed in range(300):
+            specie = genome.GearPivotSpecie()
+            specie.parse(genome.GearPivotGenome.random_genome(400, seed))
+            if not specie.gears:
+                continue
+            expected = reference_normalize(specie)
+            specie.normalize_graph()
+            self.assertEqual(dict((node, set(edges)) for (node, edges) in specie.graph.items()), expected)
+
+class ResumeTest(unittest.TestCase):
+    def test_resume_without_checkpoints(self):
+        for seed in range(10):
+            genes = genome.GearPivotGenome.random_genome(300, seed)
+            specie = genome.GearPivotSpecie()
+            specie.parse(genes, track_parameters=True)
+            other = mutate(genes, 150, 7)
+            resumed = specie.resume(other, 150)
+            self.assertEqual(mechanism_hash(resumed), parse_hash(other))
+            self.assertNotEqual(resumed.parameters, None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import random
+import unittest
+
+from linkage import genome
+from linkage import graph
+
+def random_graph(graph_class, seed, size=12, edges=16):
+    rng = random.Random(seed)
+    nodes = range(size)
+    result = graph_class(nodes)
+    for x in range(edges):
+        (node_a, node_b) = rng.sample(nodes, 2)
+        if node_b not in result[node_a]:
+            result.connect(node_a, node_b, rng.choice([1, 2.5, 4, "link"]))
+    return result
+
+def path_weight(source, path):
+    total = 0
+    for (node_a, node_b) in zip(path[:-1], path[1:]):
+        weight = source[node_a][node_b]
+        if not isinstance(weight, (int, long, float)):
+            weight = 1
+        total += weight
+    return total
+
+def parsed_specie(seed, length=400):
+    specie = genome.GearPivotSpecie()
+    specie.parse(genome.GearPivotGenome.random_genome(length, seed))
+    return specie
+
+class CompactGraphTest(unittest.TestCase):
+    Seeds = range(100)
+
+    def assertSamePath(self, source, compact, node_a, node_b):
+        expected = source.path(node_a, node_b)
+        result = compact.path(node_a, node_b)
+        if expected == None:
+            self.assertEqual(result, None)
+            return
+        (path, distance) = result
+        self.assertAlmostEqual(distance, expected[1])
+        self.assertEqual((path[0], path[-1]), (node_a, node_b))
+        self.assertAlmostEqual(path_weight(source, path), distance)
+
+    def test_path_matches_graph(self):
+        for seed in self.Seeds:
+            for graph_class in (graph.BidirectedGraph, graph.DirectedGraph):
+                source = random_graph(graph_class, seed)
+                compact = source.freeze()
+                for node_a in source:
+                    for node_b in source:
+                        self.assertSamePath(source, compact, node_a, node_b)
+
+    def test_path_matches_graph_on_species(self):
+        for seed in range(20):
+            specie = parsed_specie(seed)
+            compact = specie.graph.freeze()
+            nodes = sorted(specie.graph, key=lambda node: node.name)
+            for node_b in nodes[::7]:
+                self.assertSamePath(specie.graph, compact, specie.gears[0], node_b)
+
+    def test_components_match_bfs_walk(self):
+        for seed in range(20):
+            specie = parsed_specie(seed)
+            compact = specie.graph.freeze()
+            labels = compact.connected_components()
+            for node in compact.nodes[::5]:
+                reached = specie.bfs_walk(node)
+                same = set(other for (other, label) in zip(compact.nodes, labels)
+                           if label == labels[compact.index[node]])
+                self.assertEqual(same, reached)
+
+if __name__ == "__main__":
+    unittest.main()
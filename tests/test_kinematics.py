@@ -0,0 +1,50 @@
+import math
+import random
+import unittest
+
+import numpy
+
+from linkage import kinematics
+from linkage import physics
+
+def random_mechanism(seed):
+    # A gear train driving two linkages pinned to each other, as in
+    # physics.use_case_one, with random dimensions.
+    rng = random.Random(seed)
+    builder = physics.WorldBuild(physics.World((500, 500)))
+    for x in range(rng.randint(2, 4)):
+        builder.add_gear(number_of_teeth=rng.randint(10, 60))
+    for (gear_a, gear_b) in zip(builder.gears[:-1], builder.gears[1:]):
+        builder.constrain_gear_gear(gear_a, gear_b, rng.uniform(0, 2 * math.pi))
+    for gear in rng.sample(builder.gears, 2):
+        builder.add_linkage(length=rng.uniform(20, 120))
+        radius = rng.uniform(0, gear._gear.pitch_radius)
+        builder.constrain_gear_linkage(gear, rng.uniform(0, 2 * math.pi), radius, builder.linkages[-1])
+    (linkage_a, linkage_b) = builder.linkages
+    builder.constrain_linkage_linkage(linkage_a, linkage_b, rng.uniform(0, linkage_a.length),
+                                      rng.uniform(0, linkage_b.length))
+    builder.layout()
+    return builder
+
+class SweepTest(unittest.TestCase):
+    def test_angle_zero_matches_prepare_embed(self):
+        assembled = 0
+        for seed in range(200):
+            builder = random_mechanism(seed)
+            positions = kinematics.KinematicSolver(builder).sweep([0.0])
+            try:
+                for linkage in builder.linkages:
+                    linkage.prepare_embed()
+            except ValueError:
+                for linkage in builder.linkages:
+                    self.assertTrue(numpy.isnan(positions[linkage][1]).all())
+                continue
+            assembled += 1
+            for linkage in builder.linkages:
+                (position_a, position_b) = positions[linkage]
+                numpy.testing.assert_allclose(position_a[0], linkage.position_a, atol=1e-9)
+                numpy.testing.assert_allclose(position_b[0], linkage.position_b, atol=1e-9)
+        self.assertTrue(assembled > 20)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import math
+import unittest
+
+import numpy
+
+from linkage import trajectory
+
+def circle(count, radius=1.0, phase=0.0):
+    t = numpy.linspace(0, 2 * math.pi, count, endpoint=False) + phase
+    return numpy.column_stack((radius * numpy.cos(t), radius * numpy.sin(t)))
+
+def figure_eight(count, phase=0.0):
+    # lemniscate of Gerono, crossing itself once at the origin
+    t = numpy.linspace(0, 2 * math.pi, count, endpoint=False) + phase
+    return numpy.column_stack((numpy.sin(t), numpy.sin(t) * numpy.cos(t)))
+
+class CurvatureTest(unittest.TestCase):
+    Counts = (16, 64, 257, 1000)
+
+    def test_circle(self):
+        for count in self.Counts:
+            for radius in (0.5, 3.0):
+                stats = trajectory.curvature_stats(circle(count, radius))
+                self.assertAlmostEqual(stats["total"], 2 * math.pi)
+                self.assertAlmostEqual(stats["turns"], 1.0)
+                self.assertAlmostEqual(stats["total"], 2 * math.pi * stats["turns"])
+                # the chord lengths make the discrete curvature a little
+                # larger than 1 / radius
+                self.assertTrue(abs(stats["mean"] * radius - 1) < 0.01 or count < 64)
+                self.assertAlmostEqual(stats["max"], stats["mean"])
+
+    def test_clockwise_circle(self):
+        stats = trajectory.curvature_stats(circle(100)[::-1])
+        self.assertAlmostEqual(stats["total"], -2 * math.pi)
+        self.assertAlmostEqual(stats["turns"], -1.0)
+
+    def test_figure_eight(self):
+        for count in self.Counts:
+            stats = trajectory.curvature_stats(figure_eight(count, 0.1))
+            self.assertAlmostEqual(stats["total"], 0.0)
+            self.assertAlmostEqual(stats["turns"], 0.0)
+            self.assertTrue(stats["mean"] > 0)
+
+    def test_stack(self):
+        stack = numpy.array([circle(64), figure_eight(64, 0.1)])
+        stats = trajectory.curvature_stats(stack)
+        numpy.testing.assert_allclose(stats["total"], [2 * math.pi, 0.0], atol=1e-9)
+
+    def test_repeated_points(self):
+        points = numpy.repeat(circle(50), 3, axis=0)
+        self.assertTrue(numpy.isnan(trajectory.curvature(points)).any())
+        stats = trajectory.curvature_stats(points)
+        self.assertTrue(numpy.isfinite([stats["mean"], stats["max"], stats["total"]]).all())
+
+class IntersectionTest(unittest.TestCase):
+    def test_circle(self):
+        for count in (3, 16, 300):
+            self.assertEqual(trajectory.self_intersections(circle(count)), 0)
+
+    def test_figure_eight(self):
+        for count in (16, 64, 300, 301):
+            for phase in (0.1, 1.0):
+                self.assertEqual(trajectory.self_intersections(figure_eight(count, phase), chunk=7), 1)
+
+    def test_bowtie(self):
+        points = numpy.array([(0, 0), (1, 1), (1, 0), (0, 1)], dtype=float)
+        self.assertEqual(trajectory.self_intersections(points), 1)
+
+    def test_crossing_on_vertex(self):
+        # the first segment passes through the vertex at (1, 1)
+        points = numpy.array([(0, 0), (2, 2), (2, 0), (1, 1), (0, 2)], dtype=float)
+        self.assertEqual(trajectory.self_intersections(points), 1)
+
+    def test_crossing_on_shared_vertex(self):
+        # a figure-eight that passes through the origin at two sample points
+        points = numpy.array([(0, 0), (1, 1), (1, -1), (0, 0), (-1, 1), (-1, -1)], dtype=float)
+        self.assertEqual(trajectory.self_intersections(points), 1)
+
+    def test_stack(self):
+        stack = numpy.array([circle(40), figure_eight(40, 0.1)])
+        self.assertEqual(list(trajectory.self_intersections(stack)), [0, 1])
+
+class ResampleTest(unittest.TestCase):
+    def test_length(self):
+        for curve in (circle(50, 2.0), figure_eight(333, 0.1)):
+            for count in (16, 128):
+                points = trajectory.resample(curve, count)
+                self.assertEqual(points.shape, (count, 2))
+                delta = numpy.roll(points, -1, axis=0) - points
+                steps = numpy.hypot(delta[:, 0], delta[:, 1])
+                # evenly spaced, and no longer than the curve
+                self.assertTrue(steps.max() - steps.min() < 0.1 * steps.mean())
+                self.assertTrue(steps.sum() <= trajectory.arc_length(curve, closed=True) + 1e-9)
+
+if __name__ == "__main__":
+    unittest.main()